@@ -0,0 +1,157 @@
+# backtest.py
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import analysis.predict as predict
+import analysis.predict_ARIMA as predict_ARIMA
+import analysis.predict_AR as predict_AR
+import analysis.order_search as order_search
+import analysis.fit_processes as fit_processes
+
+# Months of data the first fold is trained on. Every later fold adds one month (an expanding window).
+min_train_months = 60
+
+# Number of months forecast from each origin.
+max_horizon = 12
+
+# Models backtested by default. 'AR' (the NumPy autoregressive model) can be backtested as well.
+backtest_models = ['SARIMA', 'ARIMA', 'LinReg']
+
+# Models refitted on every fold because fitting them is cheap.
+refitted_models = ['LinReg', 'AR']
+
+def model_orders(model_name, category, orders_file=None):
+    """Orders used for a model and category: the ones chosen by the order search, otherwise the defaults."""
+    order, seasonal_order = order_search.chosen_orders(model_name, category, orders_file)
+    if model_name == 'SARIMA':
+        return order or predict.sarima_order, seasonal_order or predict.sarima_seasonal_order
+    return order or predict_ARIMA.arima_order, None
+
+def build_model(model_name, values, order, seasonal_order):
+    """Build the state space model for a model name on plain values."""
+    # statsmodels is only imported in the workers that fit the ARIMA-type models.
+    from statsmodels.tsa.arima.model import ARIMA
+    from statsmodels.tsa.statespace.sarimax import SARIMAX
+    if model_name == 'SARIMA':
+        return SARIMAX(values, order=order, seasonal_order=seasonal_order)
+    return ARIMA(values, order=order)
+
+def fit_initial(model_name, values, order, seasonal_order, train_months):
+    """Fit a model on the first fold's training window and return its parameters."""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        model = build_model(model_name, values[:train_months], order, seasonal_order)
+        model_fit = model.fit(disp=False) if model_name == 'SARIMA' else model.fit()
+    return model_fit.params
+
+def forecast_origins(model_name, values, origins, horizon, params=None, order=None, seasonal_order=None):
+    """
+    Forecast up to horizon months ahead from each origin, using only the data before it.
+
+    ARIMA-type models keep the parameters fitted on the first fold. The state at the first origin comes from
+    one filter pass; each later origin only filters the months added since the previous one. Linear Regression
+    and AR are refitted on every fold, which only takes a small least squares or Yule-Walker solve.
+    Returns an array of (origin, horizon, forecast) rows.
+    """
+    rows = []
+    if model_name == 'LinReg':
+        # The regressor is the month's position in the series; the forecast h months ahead is at origin - 1 + h.
+        months = np.arange(len(values), dtype=float)
+        steps = np.arange(1, horizon + 1)
+        for origin in origins:
+            slope, intercept = np.polyfit(months[:origin], values[:origin], 1)
+            rows.extend(zip([origin] * horizon, steps, intercept + slope * (origin - 1 + steps)))
+        return np.array(rows, dtype=float).reshape(-1, 3)
+
+    if model_name == 'AR':
+        steps = np.arange(1, horizon + 1)
+        for origin in origins:
+            forecast = predict_AR.forecast_ar(predict_AR.fit_yule_walker(values[:origin]), horizon)[:, 0]
+            rows.extend(zip([origin] * horizon, steps, forecast))
+        return np.array(rows, dtype=float).reshape(-1, 3)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        model_fit = build_model(model_name, values[:origins[0]], order, seasonal_order).filter(params)
+        previous = origins[0]
+        for origin in origins:
+            if origin > previous:
+                model_fit = model_fit.extend(values[previous:origin])
+                previous = origin
+            forecast = model_fit.forecast(horizon)
+            rows.extend(zip([origin] * horizon, range(1, horizon + 1), forecast))
+    return np.array(rows, dtype=float).reshape(-1, 3)
+
+def split_origins(origins, blocks):
+    """Split the origins into contiguous blocks, one per parallel job."""
+    return [block for block in np.array_split(np.asarray(origins), blocks) if len(block)]
+
+def run_backtest(data, categories, models=None, train_months=None, horizon=None, max_workers=None, orders_file=None):
+    """
+    Rolling-origin backtest of each model and category on the 'Inflation Rate' series.
+
+    The first fold is trained on train_months months; each fold after that moves the origin one month
+    later and forecasts horizon months ahead. Fold blocks are run in a process pool. SARIMA and ARIMA use the
+    orders saved in orders_file by the order search, or the defaults.
+    Returns one row per forecast: Model, Category, Origin, Horizon, Forecast, Actual and Error.
+    """
+    models = models or backtest_models
+    train_months = train_months or min_train_months
+    horizon = horizon or max_horizon
+    workers = max_workers or os.cpu_count() or 1
+
+    series = {category: data.loc[data['Category'] == category, 'Inflation Rate'].to_numpy(dtype=float)
+              for category in categories}
+
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=fit_processes.process_context()) as executor:
+        # Fit the ARIMA-type models once per category on the first training window.
+        initial = {}
+        for model_name in models:
+            if model_name in refitted_models:
+                continue
+            for category in categories:
+                if len(series[category]) <= train_months:
+                    continue
+                order, seasonal_order = model_orders(model_name, category, orders_file)
+                initial[model_name, category] = (executor.submit(fit_initial, model_name, series[category], order,
+                                                                 seasonal_order, train_months), order, seasonal_order)
+
+        # Forecast from every origin, in blocks of consecutive origins.
+        jobs = []
+        for model_name in models:
+            for category in categories:
+                values = series[category]
+                origins = range(train_months, len(values))
+                if not len(origins):
+                    continue
+                if model_name in refitted_models:
+                    params, order, seasonal_order = None, None, None
+                else:
+                    params_future, order, seasonal_order = initial[model_name, category]
+                    params = params_future.result()
+                for block in split_origins(origins, workers):
+                    future = executor.submit(forecast_origins, model_name, values, block, horizon, params, order, seasonal_order)
+                    jobs.append((model_name, category, future))
+
+        frames = []
+        for model_name, category, future in jobs:
+            forecasts = future.result()
+            values = series[category]
+            frame = pd.DataFrame(forecasts, columns=['Origin', 'Horizon', 'Forecast'])
+            frame = frame.astype({'Origin': int, 'Horizon': int})
+
+            # Forecasts past the end of the data have nothing to be compared with.
+            target = frame['Origin'] + frame['Horizon'] - 1
+            in_range = target < len(values)
+            frame = frame[in_range].assign(Actual=values[target[in_range]])
+            frame.insert(0, 'Category', category)
+            frame.insert(0, 'Model', model_name)
+            frames.append(frame)
+
+    errors = pd.concat(frames, ignore_index=True)
+    errors['Error'] = errors['Forecast'] - errors['Actual']
+    return errors
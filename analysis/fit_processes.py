@@ -0,0 +1,17 @@
+# fit_processes.py
+import multiprocessing
+
+# Worker processes for model fits are never forked from the pipeline itself. Stages run in threads, so a fork
+# could copy a lock another thread holds at that moment (logging, pandas, BLAS) and leave the child deadlocked.
+# They are started from a clean fork server instead, or spawned where the platform has no fork server.
+start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+# Modules the fork server imports once, so every worker starts with pandas and the model code already loaded.
+preload_modules = ['analysis.fit_scheduler']
+
+def process_context():
+    """Multiprocessing context used for every model-fitting worker."""
+    context = multiprocessing.get_context(start_method)
+    if start_method == 'forkserver':
+        context.set_forkserver_preload(preload_modules)
+    return context
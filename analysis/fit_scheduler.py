@@ -0,0 +1,186 @@
+# fit_scheduler.py
+import os
+import time
+import logging
+from collections import deque
+from multiprocessing.connection import wait
+
+import numpy as np
+import pandas as pd
+
+import analysis.predict as predict
+import analysis.predict_ARIMA as predict_ARIMA
+import analysis.predict_LinReg as predict_LinReg
+import analysis.predict_AR as predict_AR
+import analysis.order_search as order_search
+import analysis.fit_processes as fit_processes
+
+logger = logging.getLogger(__name__)
+
+# Every forecaster takes the same arguments. cache_dir is the model cache directory and orders_file the file of
+# searched orders, which only the ARIMA-type models use.
+def forecast_sarima(data, category, future_dates, cache_dir=None, orders_file=None):
+    """Fit a SARIMA model for one category and forecast one value per future date."""
+    # Orders chosen by a previous order search are used when there are any, otherwise the defaults.
+    order, seasonal_order = order_search.chosen_orders('SARIMA', category, orders_file)
+    model_fit = predict.fit_sarima_model(data, category, order=order, seasonal_order=seasonal_order, cache_dir=cache_dir)
+    return predict.forecast_inflation(model_fit, len(future_dates))
+
+def forecast_arima(data, category, future_dates, cache_dir=None, orders_file=None):
+    """Fit an ARIMA model for one category and forecast one value per future date."""
+    order, _ = order_search.chosen_orders('ARIMA', category, orders_file)
+    model_fit = predict_ARIMA.fit_arima_model(data, category, order=order, cache_dir=cache_dir)
+    return predict_ARIMA.forecast_inflation(model_fit, len(future_dates))
+
+def forecast_linreg(data, category, future_dates, cache_dir=None, orders_file=None):
+    """Fit a linear regression for one category and predict one value per future date."""
+    return predict_LinReg.predict_inflation(data[data['Category'] == category], future_dates)
+
+def forecast_ar(data, category, future_dates, cache_dir=None, orders_file=None):
+    """Fit a NumPy AR model for one category and forecast one value per future date."""
+    model_fit = predict_AR.fit_ar_model(data, category)
+    return predict_AR.forecast_inflation(model_fit, len(future_dates))
+
+def forecast_ar_batch(data, categories, future_dates):
+    """Fit NumPy AR models for every category at once; returns a future dates x categories array."""
+    return predict_AR.forecast_ar(predict_AR.fit_ar_models(data, categories), len(future_dates))
+
+def forecast_linreg_batch(data, categories, future_dates):
+    """Fit a linear regression for every category at once; returns a future dates x categories array."""
+    return predict_LinReg.predict_inflation_batch(data, categories, future_dates)
+
+# Forecasting function used by each model name.
+FORECASTERS = {
+    'SARIMA': forecast_sarima,
+    'ARIMA': forecast_arima,
+    'LinReg': forecast_linreg,
+    'AR': forecast_ar
+}
+
+# Models that forecast all categories in one call. These run in the calling process instead of the pool,
+# since the batched fit is cheaper than sending the data to a worker.
+BATCH_FORECASTERS = {
+    'LinReg': forecast_linreg_batch,
+    'AR': forecast_ar_batch
+}
+
+def build_forecast_frame(category, future_dates, forecast):
+    """Build the Period/Category/Inflation Rate frame saved for one category."""
+    return pd.DataFrame({
+        'Period': future_dates,
+        'Category': category,
+        'Inflation Rate': np.asarray(forecast, dtype=float)
+    })
+
+def run_job(model, category, data, future_dates, cache_dir=None, orders_file=None):
+    """Run a single model/category forecast. Executed inside a worker process."""
+    print(f"Processing category: {category} ({model})")
+    forecast = FORECASTERS[model](data, category, future_dates, cache_dir, orders_file)
+    return build_forecast_frame(category, future_dates, forecast)
+
+def job_worker(sender, model, category, data, future_dates, cache_dir=None, orders_file=None):
+    """Entry point of a job's process: send back ('ok', frame) or ('error', message) through the pipe."""
+    try:
+        result = ('ok', run_job(model, category, data, future_dates, cache_dir, orders_file))
+    except Exception as e:
+        result = ('error', str(e))
+    sender.send(result)
+    sender.close()
+
+def failed_forecast(model, category, future_dates, message):
+    """Log a failed or timed out fit and return its NaN forecasts, the same as a failed fit."""
+    logger.error(f"{model} fit for category {category} {message}")
+    print(f"{model} fit for category {category} {message}")
+    return build_forecast_frame(category, future_dates, np.full(len(future_dates), np.nan))
+
+def run_forecasts(jobs, max_workers=None, timeout=None, cache_dir=None, orders_file=None):
+    """
+    Fit and forecast (model, category, data, future_dates) jobs, each in its own process.
+
+    Results are returned in the same order as the jobs, regardless of which finishes first.
+    At most max_workers jobs run at once (default: the number of CPUs). timeout is the number of seconds a
+    job may run, counted from when its process starts; a job still running then is terminated. A job that
+    fails or times out yields NaN forecasts, the same as a failed fit. Fitted parameters are cached in
+    cache_dir (default: model_cache.cache_dir), and SARIMA and ARIMA use the orders saved in orders_file
+    (default: order_search.orders_file).
+    """
+    results = [None] * len(jobs)
+    max_workers = max_workers or os.cpu_count() or 1
+
+    # Jobs of batched models that share their data are fitted together.
+    batches = {}
+    for index, (model, category, data, future_dates) in enumerate(jobs):
+        if model in BATCH_FORECASTERS:
+            batches.setdefault((model, id(data), id(future_dates)), []).append(index)
+
+    # Every other job gets a process of its own, so a hung fit can be terminated once its time is up.
+    queued = deque(index for index, job in enumerate(jobs) if job[0] not in BATCH_FORECASTERS)
+    running = {}
+    context = fit_processes.process_context()
+
+    def start_jobs():
+        while queued and len(running) < max_workers:
+            index = queued.popleft()
+            model, category, data, future_dates = jobs[index]
+            receiver, sender = context.Pipe(duplex=False)
+            # Only the category's own rows are sent to the worker to keep pickling cheap.
+            process = context.Process(target=job_worker, daemon=True,
+                                       args=(sender, model, category, data[data['Category'] == category], future_dates, cache_dir, orders_file))
+            process.start()
+            sender.close()
+            deadline = None if timeout is None else time.monotonic() + timeout
+            running[receiver] = (index, process, deadline)
+
+    try:
+        start_jobs()
+
+        # Batched models run here while the worker processes fit the others.
+        for (model, _, _), indices in batches.items():
+            _, _, data, future_dates = jobs[indices[0]]
+            batch_categories = [jobs[index][1] for index in indices]
+            print(f"Processing categories: {', '.join(batch_categories)} ({model})")
+            try:
+                forecasts = BATCH_FORECASTERS[model](data, batch_categories, future_dates)
+            except Exception as e:
+                logger.error(f"{model} fit failed: {e}")
+                print(f"{model} fit failed: {e}")
+                forecasts = np.full((len(future_dates), len(indices)), np.nan)
+            for column, index in enumerate(indices):
+                results[index] = build_forecast_frame(jobs[index][1], future_dates, forecasts[:, column])
+
+        while running:
+            deadlines = [deadline for _, _, deadline in running.values() if deadline is not None]
+            wait_time = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+
+            # Finished jobs are collected before any deadline is checked, so a result that is already
+            # waiting in its pipe is never thrown away.
+            for receiver in wait(list(running), wait_time):
+                index, process, _ = running.pop(receiver)
+                model, category, _, future_dates = jobs[index]
+                try:
+                    status, value = receiver.recv()
+                except EOFError:
+                    process.join()
+                    status, value = 'error', f"worker exited with code {process.exitcode}"
+                receiver.close()
+                process.join()
+                results[index] = value if status == 'ok' else failed_forecast(model, category, future_dates, f"failed: {value}")
+
+            now = time.monotonic()
+            for receiver, (index, process, deadline) in list(running.items()):
+                if deadline is not None and now >= deadline:
+                    process.terminate()
+                    process.join()
+                    receiver.close()
+                    del running[receiver]
+                    model, category, _, future_dates = jobs[index]
+                    results[index] = failed_forecast(model, category, future_dates, f"timed out after {timeout} seconds")
+
+            start_jobs()
+    finally:
+        # Nothing may outlive the run, or the interpreter would wait for it on exit.
+        for receiver, (_, process, _) in running.items():
+            process.terminate()
+            process.join()
+            receiver.close()
+    return results
@@ -0,0 +1,30 @@
+# incremental.py
+import numpy as np
+
+def new_observations(model_fit, series):
+    """
+    Return the observations in series that arrived after the data model_fit was fitted on.
+
+    Returns None when the series no longer starts with the fitted data (for example after a
+    BLS revision), in which case the model has to be refitted from scratch.
+    """
+    nobs = model_fit.model.nobs
+    fitted = np.asarray(model_fit.model.endog).ravel()
+    if len(series) < nobs or not np.allclose(series.values[:nobs], fitted, equal_nan=True):
+        return None
+    return series.iloc[nobs:]
+
+def parameters_drifted(updated_fit, params, drift_threshold=0.05):
+    """
+    Score test of whether the previous parameters are still optimal for the extended data.
+
+    The statistic uses the per-observation scores at the previous parameters (outer product of
+    gradients), so it only costs a few filter passes instead of a new optimization. Returns True
+    when the test rejects at the drift_threshold significance level.
+    """
+    from scipy import stats
+
+    score_obs = updated_fit.model.score_obs(np.asarray(params))
+    score = score_obs.sum(axis=0)
+    statistic = score @ np.linalg.pinv(score_obs.T @ score_obs) @ score
+    return stats.chi2.sf(statistic, len(score)) < drift_threshold
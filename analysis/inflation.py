@@ -1,9 +1,11 @@
 # inflation.py
 import pandas as pd
+import etl.storage as storage
+import etl.periods as periods
 
 # Function to load the transformed Food CPI data
 def load_data(file_path):
-    df = pd.read_csv(file_path)
+    df = storage.load_dataset(file_path)
     return df
 
 # Function to create a mapping to represent months with values.
@@ -25,36 +27,32 @@ def clean_data(df):
     df = df.sort_values(by=['Category', 'Year', 'Period'])
     return df
 
-# Function to calculate the inflation rate
-def calculate_inflation(df, month_inverse_mapping):
-    inflation_data = []
-    for category in df['Category'].unique():
-        category_df = df[df['Category'] == category]
-        for i in range(1, len(category_df)):
-            prev_row = category_df.iloc[i - 1]
-            curr_row = category_df.iloc[i]
-            
-            prev_cpi = prev_row['CPI']
-            curr_cpi = curr_row['CPI']
-            
-            if (curr_row['Year'] == prev_row['Year'] and curr_row['Period'] == prev_row['Period'] + 1) or \
-               (curr_row['Year'] == str(int(prev_row['Year']) + 1) and curr_row['Period'] == 1 and prev_row['Period'] == 12):
-                if prev_cpi != 0:
-                    inflation_rate = ((curr_cpi - prev_cpi) / prev_cpi) * 100
-                else:
-                    inflation_rate = None
-                
-                curr_period = f"{month_inverse_mapping[curr_row['Period']]} {curr_row['Year']}"
-                
-                inflation_data.append({
-                    'Period': curr_period,
-                    'Category': category,
-                    'Inflation Rate': inflation_rate
-                })
-    inflation_df = pd.DataFrame(inflation_data)
+# Function to calculate the inflation rate. Periods are returned as monthly pandas periods and only written out
+# as 'Month Year' text when the data is saved to CSV.
+# Each row is placed on a monthly ordinal (year * 12 + month) so that a grouped shift per category lines up
+# every month with the one before it. A rate is only produced when the previous row is the directly preceding
+# month (including December to January), so gaps in a series are skipped just like the row-by-row check did.
+def calculate_inflation(df):
+    df = df.sort_values(by=['Category', 'Year', 'Period'], kind='stable')
+    year = df['Year'].astype(int)
+    month = df['Period'].astype(int)
+    cpi = df['CPI'].astype(float)
+
+    month_index = year * 12 + month
+    prev_month_index = month_index.groupby(df['Category']).shift()
+    prev_cpi = cpi.groupby(df['Category']).shift()
+
+    adjacent = (month_index - prev_month_index) == 1
+    inflation_rate = ((cpi - prev_cpi) / prev_cpi * 100).where(prev_cpi != 0)
+
+    inflation_df = pd.DataFrame({
+        'Period': periods.from_year_month(year[adjacent], month[adjacent]),
+        'Category': df.loc[adjacent, 'Category'],
+        'Inflation Rate': inflation_rate[adjacent]
+    }).reset_index(drop=True)
     return inflation_df
 
-# Function to save the inflation data to CSV
+# Function to save the inflation data in the configured storage format
 def save_data(df, file_path):
-    df.to_csv(file_path, index=False)
+    file_path = storage.save_dataset(df, file_path)
     print(f"Inflation data saved to: {file_path}")
\ No newline at end of file
@@ -0,0 +1,107 @@
+# model_cache.py
+import os
+import hashlib
+import pickle
+import pandas as pd
+
+# Default directory where fitted model parameters are stored between runs. The pipeline keeps its cache in the
+# output directory and passes it explicitly.
+# Only the parameter vector is kept; a cached model is rebuilt with a single filter pass instead of a full fit.
+cache_dir = 'data/model_cache/'
+
+# Eviction limits. The least recently used entries are removed first once either limit is exceeded.
+max_entries = 4096
+max_bytes = 64 * 1024 * 1024
+
+def fingerprint(series, model_name, order, seasonal_order=None):
+    """Hash a category's input series together with the model name and orders."""
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(series, index=True).values.tobytes())
+    digest.update(repr((model_name, tuple(order), tuple(seasonal_order or ()))).encode())
+    return digest.hexdigest()
+
+def latest_key(model_name, category, order, seasonal_order=None):
+    """Key of the most recent fit for a category, independent of the data it was fitted on."""
+    identity = repr(('latest', model_name, category, tuple(order), tuple(seasonal_order or ())))
+    return hashlib.sha256(identity.encode()).hexdigest()
+
+def cache_path(key, directory=None):
+    """Path of the cache file for the given fingerprint."""
+    return os.path.join(directory or cache_dir, f'{key}.pkl')
+
+def load_params(key, directory=None):
+    """Return the cached parameter vector for a fingerprint, or None if it is not cached."""
+    path = cache_path(key, directory)
+    try:
+        with open(path, 'rb') as f:
+            params = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Discarding unreadable cache entry {path}: {e}")
+        remove_file(path)
+        return None
+
+    # Mark the entry as recently used for LRU eviction.
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return params
+
+def save_params(key, params, directory=None):
+    """Store a fitted parameter vector under its fingerprint and evict old entries if the cache is over its limits."""
+    directory = directory or cache_dir
+    os.makedirs(directory, exist_ok=True)
+    path = cache_path(key, directory)
+
+    # Write to a temporary file first so concurrent readers never see a partial pickle.
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(params, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+    evict(directory)
+
+def load_latest(model_name, category, order, seasonal_order=None, directory=None):
+    """Return the (series, params) of the most recent fit for a category, or None."""
+    return load_params(latest_key(model_name, category, order, seasonal_order), directory)
+
+def save_latest(model_name, category, order, series, params, seasonal_order=None, directory=None):
+    """Remember the series and parameters of the most recent fit for a category."""
+    save_params(latest_key(model_name, category, order, seasonal_order), (series, params), directory)
+
+def evict(directory=None, entries_limit=None, bytes_limit=None):
+    """Remove least recently used entries until the cache is within its entry and size limits."""
+    directory = directory or cache_dir
+    entries_limit = max_entries if entries_limit is None else entries_limit
+    bytes_limit = max_bytes if bytes_limit is None else bytes_limit
+
+    entries = []
+    for name in os.listdir(directory):
+        if not name.endswith('.pkl'):
+            continue
+        try:
+            stat = os.stat(os.path.join(directory, name))
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, os.path.join(directory, name)))
+
+    # Oldest first.
+    entries.sort()
+    total_bytes = sum(size for _, size, _ in entries)
+    while entries and (len(entries) > entries_limit or total_bytes > bytes_limit):
+        _, size, path = entries.pop(0)
+        remove_file(path)
+        total_bytes -= size
+
+def clear(directory=None):
+    """Remove every cache entry."""
+    evict(directory, entries_limit=0, bytes_limit=0)
+
+def remove_file(path):
+    """Remove a file, ignoring it if another process already removed it."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -1,14 +1,17 @@
 import os
 import pandas as pd
-from sklearn.metrics import mean_absolute_error, mean_squared_error
 import numpy as np
+import etl.storage as storage
 
 def load_data(file_path):
-    """Load data from a CSV file."""
-    return pd.read_csv(file_path)
+    """Load a dataset saved in the configured storage format."""
+    return storage.load_dataset(file_path)
 
 def calculate_metrics(historical_data, forecasted_data):
     """Calculate evaluation metrics."""
+    # scikit-learn is only needed here, so it is not loaded with the module.
+    from sklearn.metrics import mean_absolute_error, mean_squared_error
+
     mae = mean_absolute_error(historical_data, forecasted_data)
     mse = mean_squared_error(historical_data, forecasted_data)
     rmse = np.sqrt(mse)
@@ -27,7 +30,18 @@ def save_metrics_to_csv(metrics, file_path):
     metrics_df.to_csv(file_path, index=False)
     print(f"Metrics saved to: {file_path}. Please check them for the evaluation results.")
 
-def align_data_lengths(historical_data, forecasted_data):
-    """Align the lengths of historical and forecasted data."""
-    min_length = min(len(historical_data), len(forecasted_data))
-    return historical_data[:min_length], forecasted_data[:min_length]
+def horizon_metrics(errors):
+    """Calculate the evaluation metrics of backtest forecasts for every model, category and horizon."""
+    grouped = errors.groupby(['Model', 'Category', 'Horizon'], observed=True)
+    metrics_df = grouped['Error'].agg(
+        MAE=lambda error: error.abs().mean(),
+        MSE=lambda error: (error ** 2).mean(),
+        Folds='count'
+    ).reset_index()
+    metrics_df.insert(5, 'RMSE', np.sqrt(metrics_df['MSE']))
+    return metrics_df
+
+def save_horizon_metrics_to_csv(metrics_df, file_path):
+    """Save the per-horizon evaluation metrics to a CSV file."""
+    metrics_df.to_csv(file_path, index=False)
+    print(f"Per-horizon metrics saved to: {file_path}.")
@@ -0,0 +1,167 @@
+# order_search.py
+import os
+import json
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import analysis.model_cache as model_cache
+import analysis.fit_processes as fit_processes
+
+# Default file where the orders chosen for each model and category are kept. Fits use these orders once they
+# exist, so the search only has to run again when asked to. The pipeline keeps the file in the output directory
+# and passes it explicitly.
+orders_file = 'data/model_orders.json'
+
+# Information criterion used to compare candidates: 'aic' or 'bic'.
+default_criterion = 'aic'
+
+# Differencing is kept fixed; the search covers the AR and MA orders up to these limits.
+search_limits = {
+    'SARIMA': {'p': 3, 'q': 3, 'P': 2, 'Q': 2},
+    'ARIMA': {'p': 5, 'q': 5}
+}
+differencing = {'SARIMA': (1, 1), 'ARIMA': (1, 0)}
+seasonal_period = 12
+
+# Candidates every search starts from (p, q, P, Q), following the stepwise auto-ARIMA procedure.
+initial_candidates = [(2, 2, 1, 1), (0, 0, 0, 0), (1, 0, 1, 0), (0, 1, 0, 1)]
+
+def order_limits(model_name):
+    """Largest (p, q, P, Q) searched for a model."""
+    limits = search_limits[model_name]
+    return limits['p'], limits['q'], limits.get('P', 0), limits.get('Q', 0)
+
+def candidate_orders(model_name, candidate):
+    """Turn a (p, q, P, Q) candidate into the model's order and seasonal order."""
+    p, q, P, Q = candidate
+    d, D = differencing[model_name]
+    if model_name == 'SARIMA':
+        return (p, d, q), (P, D, Q, seasonal_period)
+    return (p, d, q), None
+
+def score_candidate(model_name, series, candidate, cache_dir=None):
+    """
+    Fit one candidate and return its (aic, bic). Candidates that fail to fit score infinity.
+    Scores are cached per series in cache_dir, so repeated searches over unchanged data do not refit anything.
+    """
+    order, seasonal_order = candidate_orders(model_name, candidate)
+    key = model_cache.fingerprint(series, f'{model_name} order score', order, seasonal_order)
+    scores = model_cache.load_params(key, cache_dir)
+    if scores is not None:
+        return scores
+
+    # statsmodels is imported here rather than at the top so that reading the chosen orders stays cheap.
+    from statsmodels.tsa.arima.model import ARIMA
+    from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            if model_name == 'SARIMA':
+                model_fit = SARIMAX(series, order=order, seasonal_order=seasonal_order).fit(disp=False)
+            else:
+                model_fit = ARIMA(series, order=order).fit()
+        scores = (float(model_fit.aic), float(model_fit.bic))
+    except Exception:
+        scores = (np.inf, np.inf)
+
+    model_cache.save_params(key, scores, cache_dir)
+    return scores
+
+def neighbours(model_name, candidate):
+    """Candidates one step away: each order up or down by one, and p and q together."""
+    maxima = order_limits(model_name)
+    steps = [(1, 0, 0, 0), (0, 1, 0, 0), (1, 1, 0, 0)]
+    if model_name == 'SARIMA':
+        steps += [(0, 0, 1, 0), (0, 0, 0, 1), (0, 0, 1, 1)]
+
+    result = []
+    for step in steps:
+        for sign in (1, -1):
+            moved = tuple(value + sign * delta for value, delta in zip(candidate, step))
+            if all(0 <= value <= maximum for value, maximum in zip(moved, maxima)):
+                result.append(moved)
+    return result
+
+def search_orders(model_name, series_by_category, criterion=None, max_workers=None, cache_dir=None):
+    """
+    Stepwise search for the orders minimizing the information criterion of each category's series.
+
+    Starting from a few initial candidates, each step scores the neighbours of the best candidate so far and
+    moves to the best one while it improves the criterion, so only a small part of the grid is fitted.
+    The candidates of all categories are fitted together in a process pool, and their scores cached in cache_dir.
+    Returns {category: (order, seasonal_order, score)}.
+    """
+    criterion_index = ['aic', 'bic'].index(criterion or default_criterion)
+    maxima = order_limits(model_name)
+    start = [tuple(min(value, maximum) for value, maximum in zip(candidate, maxima)) for candidate in initial_candidates]
+
+    scores = {category: {} for category in series_by_category}
+    best = {category: None for category in series_by_category}
+    pending = {category: list(dict.fromkeys(start)) for category in series_by_category}
+
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=fit_processes.process_context()) as executor:
+        while any(pending.values()):
+            futures = {(category, candidate): executor.submit(score_candidate, model_name, series_by_category[category], candidate, cache_dir)
+                       for category, candidates in pending.items() for candidate in candidates}
+            for (category, candidate), future in futures.items():
+                scores[category][candidate] = future.result()[criterion_index]
+
+            for category in pending:
+                if not pending[category]:
+                    continue
+                step_best = min(pending[category], key=scores[category].get)
+                pending[category] = []
+                if best[category] is None or scores[category][step_best] < scores[category][best[category]]:
+                    best[category] = step_best
+                    pending[category] = [candidate for candidate in neighbours(model_name, step_best)
+                                         if candidate not in scores[category]]
+
+    result = {}
+    for category, candidate in best.items():
+        order, seasonal_order = candidate_orders(model_name, candidate)
+        result[category] = (order, seasonal_order, scores[category][candidate])
+    return result
+
+def load_orders(path=None):
+    """Load the persisted orders, keyed by model name and category."""
+    try:
+        with open(path or orders_file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_orders(model_name, chosen, path=None, criterion=None):
+    """Persist the orders chosen by search_orders for a model."""
+    path = path or orders_file
+    orders = load_orders(path)
+    orders[model_name] = {
+        category: {'order': list(order), 'seasonal_order': list(seasonal_order) if seasonal_order else None,
+                   'criterion': criterion or default_criterion, 'score': score}
+        for category, (order, seasonal_order, score) in chosen.items()
+    }
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(orders, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def chosen_orders(model_name, category, path=None):
+    """Return the persisted (order, seasonal_order) for a model and category, or (None, None) if none was chosen."""
+    entry = load_orders(path).get(model_name, {}).get(category)
+    if entry is None:
+        return None, None
+    seasonal_order = tuple(entry['seasonal_order']) if entry.get('seasonal_order') else None
+    return tuple(entry['order']), seasonal_order
+
+def select_orders(model_name, data, categories, path=None, criterion=None, max_workers=None, cache_dir=None):
+    """Search the orders of every category's 'Inflation Rate' series and persist them to path. Returns the chosen orders."""
+    series_by_category = {category: data.loc[data['Category'] == category, 'Inflation Rate'] for category in categories}
+    chosen = search_orders(model_name, series_by_category, criterion, max_workers, cache_dir)
+    save_orders(model_name, chosen, path, criterion)
+    return chosen
@@ -1,20 +1,39 @@
 import pandas as pd
-from statsmodels.tsa.statespace.sarimax import SARIMAX
 from datetime import datetime
 import numpy as np
+import analysis.model_cache as model_cache
+import etl.storage as storage
+import etl.periods as periods
+import analysis.incremental as incremental
+
+# SARIMA orders used for every category.
+sarima_order = (1, 1, 1)
+sarima_seasonal_order = (1, 1, 1, 12)
 
 def load_data(file_path):
-    """Load CSV data into a DataFrame."""
-    return pd.read_csv(file_path)
+    """Load a dataset saved in the configured storage format into a DataFrame."""
+    return storage.load_dataset(file_path)
 
 def preprocess_data(data):
-    """Ensure that 'Period' is a datetime column and set it as the index."""
-    data['Period'] = pd.to_datetime(data['Period'], format='%B %Y')
+    """Ensure that 'Period' is a monthly period column and set it as the index."""
+    data = periods.read_periods(data)
     data.set_index('Period', inplace=True)
     return data
 
-def fit_sarima_model(data, category):
-    """Fit a SARIMA model to the category data."""
+def fit_sarima_model(data, category, use_cache=True, incremental_update=True, order=None, seasonal_order=None, cache_dir=None):
+    """
+    Fit a SARIMA model to the category data, reusing a cached fit when the data has not changed.
+
+    With incremental_update, a category whose data only gained new months since its last fit is
+    extended from that fit with update_sarima_model instead of being refitted from scratch.
+    order and seasonal_order default to sarima_order and sarima_seasonal_order; cache_dir defaults to
+    model_cache.cache_dir.
+    """
+    # statsmodels takes a while to import, so it is only loaded when a model is fitted.
+    from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+    order = tuple(order or sarima_order)
+    seasonal_order = tuple(seasonal_order or sarima_seasonal_order)
     try:
         # Filter data for the specific category
         category_data = data[data['Category'] == category]['Inflation Rate']
@@ -23,15 +42,59 @@ def fit_sarima_model(data, category):
         if category_data.empty:
             raise ValueError(f"No data available for category: {category}")
         
-        # Fit the SARIMA model
-        model = SARIMAX(category_data, order=(1,1,1), seasonal_order=(1,1,1,12))  # Adjust orders as needed
-        model_fit = model.fit(disp=False)
+        model = SARIMAX(category_data, order=order, seasonal_order=seasonal_order)
+
+        # If this exact series was already fitted with the same orders, rebuild the fit from the cached parameters
+        key = model_cache.fingerprint(category_data, 'SARIMA', order, seasonal_order)
+        if use_cache:
+            params = model_cache.load_params(key, cache_dir)
+            if params is not None:
+                return model.filter(params)
+
+        # Extend the previous fit of this category if only new months were added, otherwise fit the SARIMA model
+        latest = model_cache.load_latest('SARIMA', category, order, seasonal_order, cache_dir) if use_cache and incremental_update else None
+        if latest is not None:
+            previous_series, previous_params = latest
+            previous_fit = SARIMAX(previous_series, order=order, seasonal_order=seasonal_order).filter(previous_params)
+            model_fit = update_sarima_model(previous_fit, data, category)
+        else:
+            model_fit = model.fit(disp=False)
+
+        if use_cache:
+            model_cache.save_params(key, model_fit.params, cache_dir)
+            model_cache.save_latest('SARIMA', category, order, category_data, model_fit.params, seasonal_order, cache_dir)
         
         return model_fit
     except Exception as e:
         print(f"Error fitting SARIMA model for category {category}: {e}")
         return None
 
+def update_sarima_model(model_fit, data, category, drift_threshold=0.05):
+    """
+    Extend a fitted SARIMA model with the months that arrived after it was fitted.
+
+    The new observations are appended with the previous parameters, which only costs a filter pass.
+    The model is refitted from scratch when a score test finds the parameters have drifted at the
+    drift_threshold significance level, or when the earlier data was revised.
+    """
+    category_data = data[data['Category'] == category]['Inflation Rate']
+    new_data = incremental.new_observations(model_fit, category_data)
+
+    if new_data is None:
+        print(f"Historical data changed for category {category}, refitting SARIMA model")
+    elif new_data.empty:
+        return model_fit
+    else:
+        updated_fit = model_fit.append(new_data.values)
+        if not incremental.parameters_drifted(updated_fit, model_fit.params, drift_threshold):
+            return updated_fit
+        print(f"SARIMA parameters drifted for category {category}, refitting")
+
+    # Refit with the orders of the model being extended
+    from statsmodels.tsa.statespace.sarimax import SARIMAX
+    model = SARIMAX(category_data, order=model_fit.model.order, seasonal_order=model_fit.model.seasonal_order)
+    return model.fit(disp=False)
+
 def forecast_inflation(model_fit, steps):
     """Forecast future values using the fitted SARIMA model."""
     if model_fit:
@@ -42,20 +105,18 @@ def forecast_inflation(model_fit, steps):
         return np.nan * np.zeros(steps)  # Return NaN values if model fitting failed
 
 def save_forecast_to_csv(forecasts, file_path):
-    """Save the forecasted data to a CSV file."""
+    """Save the forecasted data in the configured storage format (CSV by default) and return the path written."""
     df_forecasts = pd.DataFrame(forecasts)
-    df_forecasts.to_csv(file_path, index=False)
+    return storage.save_dataset(df_forecasts, file_path)
 
 def merge_and_save_data(historical_file, forecasted_file, output_file):
-    """Merge historical and forecasted data, sort by category, and save to CSV."""
-    historical_data = pd.read_csv(historical_file)
-    forecasted_data = pd.read_csv(forecasted_file)
-
-    # Convert 'Period' in historical data to datetime
-    historical_data['Period'] = pd.to_datetime(historical_data['Period'], format='%B %Y')
+    """Merge historical and forecasted data, sort by category, save in the configured storage format and return the path written."""
+    historical_data = storage.load_dataset(historical_file)
+    forecasted_data = storage.load_dataset(forecasted_file)
 
-    # Convert 'Period' in forecasted data to datetime
-    forecasted_data['Period'] = pd.to_datetime(forecasted_data['Period'])
+    # Both datasets share the monthly period representation
+    historical_data = periods.read_periods(historical_data)
+    forecasted_data = periods.read_periods(forecasted_data)
 
     # Combine historical and forecasted data
     combined_data = pd.concat([historical_data, forecasted_data], ignore_index=True)
@@ -63,9 +124,6 @@ def merge_and_save_data(historical_file, forecasted_file, output_file):
     # Sort by category and then by period
     combined_data.sort_values(by=['Category', 'Period'], inplace=True)
 
-    # Convert 'Period' back to 'Month Year' format
-    combined_data['Period'] = combined_data['Period'].dt.strftime('%B %Y')
-
-    # Save the combined data to a new CSV file
-    combined_data.to_csv(output_file, index=False)
+    # Save the combined data to a new file in the configured storage format
+    return storage.save_dataset(combined_data, output_file)
 
@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+import etl.storage as storage
+import etl.periods as periods
+
+# Lightweight autoregressive forecaster written in NumPy only, for fast what-if runs without statsmodels.
+# An AR(12) model fitted with the Yule-Walker equations covers a year of monthly lags, so it picks up the
+# seasonal pattern of the inflation rates as well as short-term momentum.
+ar_order = 12
+
+# A fitted model for one or more series: the series means, the AR coefficients (series x lags, most
+# recent lag first) and the last ar_order demeaned values of each series (oldest first).
+ARFit = namedtuple('ARFit', ['mean', 'coefficients', 'history'])
+
+def load_data(file_path):
+    """Load a dataset saved in the configured storage format into a DataFrame."""
+    return storage.load_dataset(file_path)
+
+def preprocess_data(data):
+    """Ensure that 'Period' is a monthly period column and set it as the index."""
+    data = periods.read_periods(data)
+    data.set_index('Period', inplace=True)
+    return data
+
+def fit_yule_walker(Y, order=None):
+    """
+    Fit an AR model to every column of Y (periods x series, NaN where a series has no value) at once.
+
+    The autocovariances of all series are computed together and the Toeplitz Yule-Walker systems are
+    solved in one batched call.
+    """
+    order = order or ar_order
+    Y = np.asarray(Y, dtype=float)
+    if Y.ndim == 1:
+        Y = Y[:, None]
+    observed = ~np.isnan(Y)
+    counts = observed.sum(axis=0)
+    if (counts <= order).any():
+        raise ValueError(f"At least {order + 1} observations are needed for an AR({order}) model")
+
+    mean = np.nanmean(Y, axis=0)
+    centered = np.where(observed, Y - mean, 0.0)
+    autocovariances = np.stack([(centered[lag:] * centered[:len(Y) - lag]).sum(axis=0) / counts
+                                for lag in range(order + 1)], axis=1)
+
+    lags = np.abs(np.subtract.outer(np.arange(order), np.arange(order)))
+    toeplitz = autocovariances[:, lags]
+    coefficients = np.linalg.solve(toeplitz, autocovariances[:, 1:, None])[:, :, 0]
+
+    # The history is each series' last order observed values.
+    history = np.stack([centered[observed[:, k]][-order:, k] for k in range(Y.shape[1])], axis=1)
+    return ARFit(mean, coefficients, history)
+
+def forecast_ar(model_fit, steps):
+    """Forecast steps values for every series of a fitted model; returns a steps x series array."""
+    order = model_fit.coefficients.shape[1]
+    values = np.vstack([model_fit.history, np.zeros((steps, model_fit.history.shape[1]))])
+    for step in range(steps):
+        position = order + step
+        # Most recent lag first, matching the coefficient order.
+        lagged = values[position - order:position][::-1]
+        values[position] = np.einsum('lk,kl->k', lagged, model_fit.coefficients)
+    return values[order:] + model_fit.mean
+
+def fit_ar_models(data, categories, order=None):
+    """Fit an AR model to the 'Inflation Rate' series of every category in one batched call."""
+    rates = data.reset_index().pivot(index='Period', columns='Category', values='Inflation Rate')
+    rates = rates.reindex(columns=pd.Index(categories, dtype=object))
+    return fit_yule_walker(rates.to_numpy(dtype=float), order)
+
+def fit_ar_model(data, category, order=None):
+    """Fit an AR model to the category data."""
+    try:
+        category_data = data[data['Category'] == category]['Inflation Rate']
+
+        # Ensure the data is not empty
+        if category_data.empty:
+            raise ValueError(f"No data available for category: {category}")
+
+        return fit_yule_walker(category_data.to_numpy(dtype=float), order)
+    except Exception as e:
+        print(f"Error fitting AR model for category {category}: {e}")
+        return None
+
+def forecast_inflation(model_fit, steps):
+    """Forecast future values using the fitted AR model."""
+    if model_fit:
+        return forecast_ar(model_fit, steps)[:, 0]
+    else:
+        return np.nan * np.zeros(steps)  # Return NaN values if model fitting failed
+
+def save_forecast_to_csv(forecasts, file_path):
+    """Save the forecasted data in the configured storage format (CSV by default) and return the path written."""
+    df_forecasts = pd.DataFrame(forecasts)
+    return storage.save_dataset(df_forecasts, file_path)
+
+def merge_and_save_data(historical_file, forecasted_file, output_file):
+    """Merge historical and forecasted data, sort by category, save in the configured storage format and return the path written."""
+    historical_data = storage.load_dataset(historical_file)
+    forecasted_data = storage.load_dataset(forecasted_file)
+
+    # Combine historical and forecasted data
+    combined_data = pd.concat([historical_data, forecasted_data], ignore_index=True)
+
+    # Sort by category and then by period
+    combined_data.sort_values(by=['Category', 'Period'], inplace=True)
+
+    # Save the combined data to a new file in the configured storage format
+    return storage.save_dataset(combined_data, output_file)
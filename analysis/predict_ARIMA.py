@@ -1,26 +1,39 @@
 import pandas as pd
-from statsmodels.tsa.arima.model import ARIMA
 from datetime import datetime
 import numpy as np
+import analysis.model_cache as model_cache
+import etl.storage as storage
+import etl.periods as periods
+import analysis.incremental as incremental
+
+# ARIMA order used for every category.
+arima_order = (5, 1, 0)
 
 def load_data(file_path):
     """
-    Function to load CSV data into a DataFrame.
+    Function to load a dataset saved in the configured storage format into a DataFrame.
     """
-    return pd.read_csv(file_path)
+    return storage.load_dataset(file_path)
 
 def preprocess_data(data):
     """
-    Function to ensure that 'Period' is a datetime column and set it as the index.
+    Function to ensure that 'Period' is a monthly period column and set it as the index.
     """
-    data['Period'] = pd.to_datetime(data['Period'], format='%B %Y')
+    data = periods.read_periods(data)
     data.set_index('Period', inplace=True)
     return data
 
-def fit_arima_model(data, category):
+def fit_arima_model(data, category, use_cache=True, incremental_update=True, order=None, cache_dir=None):
     """
-    Function to fit an ARIMA model to the category data.
+    Function to fit an ARIMA model to the category data, reusing a cached fit when the data has not changed.
+    With incremental_update, a category whose data only gained new months since its last fit is
+    extended from that fit with update_arima_model instead of being refitted from scratch.
+    order defaults to arima_order and cache_dir to model_cache.cache_dir.
     """
+    # Imports statsmodels only when a model is fitted, since loading it takes a while.
+    from statsmodels.tsa.arima.model import ARIMA
+
+    order = tuple(order or arima_order)
     try:
         # Filters data for the specific category.
         category_data = data[data['Category'] == category]['Inflation Rate']
@@ -29,15 +42,58 @@ def fit_arima_model(data, category):
         if category_data.empty:
             raise ValueError(f"No data available for category: {category}")
         
-        # Fits the ARIMA model.
-        model = ARIMA(category_data, order=(5,1,0))  # Adjust order as needed
-        model_fit = model.fit()
+        model = ARIMA(category_data, order=order)
+
+        # Rebuilds the fit from the cached parameters if this exact series was already fitted with the same order.
+        key = model_cache.fingerprint(category_data, 'ARIMA', order)
+        if use_cache:
+            params = model_cache.load_params(key, cache_dir)
+            if params is not None:
+                return model.filter(params)
+
+        # Extends the previous fit of this category if only new months were added, otherwise fits the ARIMA model.
+        latest = model_cache.load_latest('ARIMA', category, order, directory=cache_dir) if use_cache and incremental_update else None
+        if latest is not None:
+            previous_series, previous_params = latest
+            previous_fit = ARIMA(previous_series, order=order).filter(previous_params)
+            model_fit = update_arima_model(previous_fit, data, category)
+        else:
+            model_fit = model.fit()
+
+        if use_cache:
+            model_cache.save_params(key, model_fit.params, cache_dir)
+            model_cache.save_latest('ARIMA', category, order, category_data, model_fit.params, directory=cache_dir)
         
         return model_fit
     except Exception as e:
         print(f"Error fitting ARIMA model for category {category}: {e}")
         return None
 
+def update_arima_model(model_fit, data, category, drift_threshold=0.05):
+    """
+    Function to extend a fitted ARIMA model with the months that arrived after it was fitted.
+    The new observations are appended with the previous parameters, which only costs a filter pass.
+    The model is refitted from scratch when a score test finds the parameters have drifted at the
+    drift_threshold significance level, or when the earlier data was revised.
+    """
+    category_data = data[data['Category'] == category]['Inflation Rate']
+    new_data = incremental.new_observations(model_fit, category_data)
+
+    if new_data is None:
+        print(f"Historical data changed for category {category}, refitting ARIMA model")
+    elif new_data.empty:
+        return model_fit
+    else:
+        updated_fit = model_fit.append(new_data.values)
+        if not incremental.parameters_drifted(updated_fit, model_fit.params, drift_threshold):
+            return updated_fit
+        print(f"ARIMA parameters drifted for category {category}, refitting")
+
+    # Refits with the order of the model being extended.
+    from statsmodels.tsa.arima.model import ARIMA
+    model = ARIMA(category_data, order=model_fit.model.order)
+    return model.fit()
+
 def forecast_inflation(model_fit, steps):
     """
     Function to forecast future values using the fitted ARIMA model.
@@ -51,23 +107,21 @@ def forecast_inflation(model_fit, steps):
 
 def save_forecast_to_csv(forecasts, file_path):
     """
-    Function to save the forecasted data to a CSV file.
+    Function to save the forecasted data in the configured storage format (CSV by default). Returns the path written.
     """
     df_forecasts = pd.DataFrame(forecasts)
-    df_forecasts.to_csv(file_path, index=False)
+    return storage.save_dataset(df_forecasts, file_path)
 
 def merge_and_save_data(historical_file, forecasted_file, output_file):
     """
-    Function to merge historical and forecasted data, sort by category, and save to CSV.
+    Function to merge historical and forecasted data, sort by category, and save in the configured storage format.
     """
-    historical_data = pd.read_csv(historical_file)
-    forecasted_data = pd.read_csv(forecasted_file)
-
-    # Convert 'Period' in historical data to datetime
-    historical_data['Period'] = pd.to_datetime(historical_data['Period'], format='%B %Y')
+    historical_data = storage.load_dataset(historical_file)
+    forecasted_data = storage.load_dataset(forecasted_file)
 
-    # Convert 'Period' in forecasted data to datetime
-    forecasted_data['Period'] = pd.to_datetime(forecasted_data['Period'])
+    # Both datasets share the monthly period representation
+    historical_data = periods.read_periods(historical_data)
+    forecasted_data = periods.read_periods(forecasted_data)
 
     # Combine historical and forecasted data
     combined_data = pd.concat([historical_data, forecasted_data], ignore_index=True)
@@ -75,8 +129,5 @@ def merge_and_save_data(historical_file, forecasted_file, output_file):
     # Sort by category and then by period
     combined_data.sort_values(by=['Category', 'Period'], inplace=True)
 
-    # Convert 'Period' back to 'Month Year' format
-    combined_data['Period'] = combined_data['Period'].dt.strftime('%B %Y')
-
-    # Save the combined data to a new CSV file
-    combined_data.to_csv(output_file, index=False)
+    # Save the combined data to a new file in the configured storage format
+    return storage.save_dataset(combined_data, output_file)
@@ -1,11 +1,12 @@
 import pandas as pd
-from sklearn.linear_model import LinearRegression
 import numpy as np
 from datetime import datetime
+import etl.storage as storage
+import etl.periods as periods
 
 # Function to load the inflation data.
 def load_data(file_path):
-    return pd.read_csv(file_path)
+    return storage.load_dataset(file_path)
 
 # Function to parse period strings into datetime objects.
 def parse_period(period_str, month_mapping):
@@ -27,23 +28,45 @@ def convert_periods_to_numeric(df):
     df['Period_num'] = (df['Period'].dt.year - df['Period'].dt.year.min()) * 12 + df['Period'].dt.month
     return df
 
+# Function to fit a linear trend to every column of Y (one series per column, NaN where a series has no value).
+# Returns the (intercept, slope) coefficients as a 2 x series array.
+# When no values are missing, all series share one design matrix and are solved in a single lstsq call.
+# Otherwise each series is solved from its own normal equations, all in one batched solve.
+def fit_trends(x, Y):
+    design = np.column_stack([np.ones_like(x), x])
+    observed = ~np.isnan(Y)
+    if observed.all():
+        coefficients, _, _, _ = np.linalg.lstsq(design, Y, rcond=None)
+        return coefficients
+
+    weights = observed.astype(float)
+    values = np.where(observed, Y, 0.0)
+    normal_matrices = np.einsum('ni,nj,nk->kij', design, design, weights)
+    normal_vectors = np.einsum('ni,nk->ki', design, values)
+    return np.linalg.solve(normal_matrices, normal_vectors[:, :, None])[:, :, 0].T
+
+# Function to fit a linear regression to every category at once and predict future inflation rates.
+# Returns a future dates x categories array of predictions.
+def predict_inflation_batch(data, categories, future_dates):
+    rates = data.pivot(index='Period', columns='Category', values='Inflation Rate')
+    rates = rates.reindex(columns=pd.Index(categories, dtype=object))
+
+    # Periods are turned into month numbers relative to the first month, which keeps the fit well conditioned.
+    month_numbers = periods.month_index(rates.index.to_series())
+    origin = month_numbers.min()
+    coefficients = fit_trends((month_numbers - origin).to_numpy(dtype=float), rates.to_numpy(dtype=float))
+
+    future_months = periods.month_index(pd.Series(pd.PeriodIndex(future_dates, freq='M'))) - origin
+    future_design = np.column_stack([np.ones(len(future_months)), future_months.to_numpy(dtype=float)])
+    return future_design @ coefficients
+
 # Function to fit a linear regression model and predict future inflation rates.
 def predict_inflation(category_df, future_dates):
-    X = category_df[['Period_num']]
-    y = category_df['Inflation Rate']
-    model = LinearRegression()
-    model.fit(X, y)
-    
-    # Preparing future periods DataFrame with the same feature name to prevent warnings regarding validity of feature names.
-    future_periods = np.array([(date.year - category_df['Period'].dt.year.min()) * 12 + date.month for date in future_dates]).reshape(-1, 1)
-    future_periods_df = pd.DataFrame(future_periods, columns=['Period_num'])
-    
-    future_inflation = model.predict(future_periods_df)
-    return future_inflation
-
-# Function to save data to a CSV file.
+    return predict_inflation_batch(category_df.assign(Category='series'), ['series'], future_dates)[:, 0]
+
+# Function to save data in the configured storage format. Returns the path written.
 def save_data(df, file_path):
-    df.to_csv(file_path, index=False)
+    return storage.save_dataset(df, file_path)
 
 # Function to merge historical and forecasted inflation data.
 def merge_data(inflation_df, forecast_df):
@@ -51,10 +74,9 @@ def merge_data(inflation_df, forecast_df):
         inflation_df[['Period', 'Category', 'Inflation Rate']], 
         forecast_df.rename(columns={'Predicted Inflation Rate': 'Inflation Rate'})
     ], ignore_index=True)
-    merged_df['Period'] = pd.to_datetime(merged_df['Period'], format='%B %Y')
     merged_df = merged_df.sort_values(by=['Category', 'Period'])
     return merged_df
 
-def generate_future_dates(start_date, end_date):
-    """Generates a list of monthly future dates from start_date to end_date."""
-    return pd.date_range(start=start_date, end=end_date, freq='MS').tolist()
+def generate_future_dates(last_date, end_date):
+    """Generates the monthly periods after last_date (the last historical month) up to end_date."""
+    return pd.period_range(start=last_date + 1, end=end_date, freq='M')
@@ -1,23 +1,46 @@
 #price_forecast.py
+import logging
+import numpy as np
 import pandas as pd
+import etl.storage as storage
+import etl.periods as periods
+
+logger = logging.getLogger(__name__)
 
 # Defining the directory to store the processed data.
 data_dir = 'data/'
 
-def load_data():
+# Year of the supermarket sales data. Prices are adjusted relative to the start of this year.
+base_year = 2019
+
+# CPI category matching the supermarket's 'Food and beverages' product line.
+default_category = 'Food and Beverage'
+
+# CPI category used for each supermarket product line. Product lines without an entry use default_category, with a
+# warning, since that category may not describe them.
+product_line_categories = {'Food and beverages': default_category}
+
+# Sales columns re-expressed in another year's dollars by adjust_sales_prices.
+price_columns = ['Unit price', 'Total']
+
+# Sales columns re-expressed in a target month's dollars by adjust_sales_to_month.
+amount_columns = ['Unit price', 'Total', 'cogs', 'gross income']
+
+def load_data(data_dir=data_dir):
     """Load the transformed supermarket sales and predictive inflation data."""
     sales_file_path = f'{data_dir}transformed_supermarket_sales.csv'
-    sales_df = pd.read_csv(sales_file_path)
+    sales_df = storage.load_dataset(sales_file_path)
 
     inflation_file_path = f'{data_dir}predictive_inflation.csv'
-    inflation_df = pd.read_csv(inflation_file_path)
+    inflation_df = storage.load_dataset(inflation_file_path)
     
     return sales_df, inflation_df
 
 def calculate_averages(sales_df):
     """Calculate the average total and average unit price from 2019 data."""
-    average_total_2019 = sales_df['Total'].mean()
-    average_unit_price_2019 = sales_df['Unit price'].mean()
+    # Sales amounts are stored as float32; average them in full precision.
+    average_total_2019 = sales_df['Total'].astype('float64').mean()
+    average_unit_price_2019 = sales_df['Unit price'].astype('float64').mean()
 
     return average_total_2019, average_unit_price_2019
 
@@ -25,35 +48,172 @@ def apply_inflation(value, inflation_rate):
     """Apply inflation or deflation to a value based on the given inflation rate."""
     return value * (1 + inflation_rate / 100)
 
-def adjust_price(year, inflation_df, average_total_2019, average_unit_price_2019):
-    """Adjust price based on historical inflation data."""
+def build_price_index(inflation_df, base_year=base_year):
+    """
+    Build the cumulative price index for every category from monthly inflation rates.
+
+    Returns a DataFrame indexed by year with one column per category. Each value is the price level at the
+    end of that year divided by the level at the start of base_year, i.e. what one base_year dollar
+    costs in that year. Built once in O(n); every later lookup is O(1).
+    """
+    levels = build_monthly_index(inflation_df)
+
+    # Rebase to the level at the start of base_year, which is 1 when the data starts in base_year or later.
+    before_base = levels[levels.index.year < base_year]
+    base_level = before_base.iloc[-1] if not before_base.empty else 1
+
+    year_end_levels = levels.groupby(levels.index.year).last()
+    year_end_levels.index.name = 'Year'
+    return year_end_levels / base_level
+
+def build_monthly_index(inflation_df):
+    """
+    Build the cumulative price level of every category at the end of each month from monthly inflation rates.
+
+    Returns a DataFrame indexed by every month from the month before the first rate (the base month, level 1)
+    to the last one in the data, sorted, with one column per category. Months without a rate keep the previous
+    month's level. Only ratios of levels are meaningful: the level of month b divided by the level of month a is
+    what a dollar in month a costs in month b.
+    """
+    # One column of monthly rates per category. Where history and forecast overlap, the historical rate is used.
+    rates = periods.drop_duplicate_months(inflation_df).pivot(index='Period', columns='Category', values='Inflation Rate').sort_index()
+    # The first rate is the change from the month before it, so that month is included with no change.
+    rates = rates.reindex(pd.period_range(rates.index.min() - 1, rates.index.max(), freq='M', name='Period'))
+    return (1 + rates.fillna(0) / 100).cumprod()
+
+def index_factors(years, price_index, categories=default_category):
+    """Look up the price index for many years (and categories) at once. categories may be one name or one per year."""
+    years = np.atleast_1d(np.asarray(years))
+    categories = np.broadcast_to(np.asarray(categories, dtype=object), years.shape)
+
+    rows = price_index.index.get_indexer(years)
+    columns = price_index.columns.get_indexer(categories)
+    if (rows < 0).any():
+        raise ValueError(f"No inflation data for year(s): {sorted(set(years[rows < 0].tolist()))}")
+    if (columns < 0).any():
+        raise ValueError(f"No inflation data for category(ies): {sorted(set(categories[columns < 0].tolist()))}")
+
+    return price_index.to_numpy()[rows, columns]
+
+def adjust_prices(years, price_index, prices, categories=default_category):
+    """
+    Vectorized price adjustment: re-express base_year prices in each of the given years.
+    years, prices and categories are broadcast together, so one price can be adjusted to many years or many
+    prices to one year in a single call.
+    """
+    return np.asarray(prices, dtype=float) * index_factors(years, price_index, categories)
+
+def adjust_price(year, price_index, average_total_2019, average_unit_price_2019, category=default_category):
+    """Adjust the 2019 average total and unit price to the given year using the category's price index."""
     start_year = 2014
     end_year = 2030
 
     if year < start_year or year > end_year:
         raise ValueError(f"Year must be between {start_year} and {end_year}.")
-    
-    # Initialize updated values
-    updated_total = average_total_2019
-    updated_unit_price = average_unit_price_2019
-    
-    # Adjust prices based on historical inflation data
-    for index, row in inflation_df.iterrows():
-        period = row['Period']
-        inflation_rate = row['Inflation Rate']
-        
-        month_name, inflation_year = period.split(' ')
-        inflation_year = int(inflation_year)
-        
-        if inflation_year < 2019:
-            # Applying deflation model for years before 2019
-            if inflation_year <= year:
-                updated_total /= (1 + inflation_rate / 100)
-                updated_unit_price /= (1 + inflation_rate / 100)
-        else:
-            # Applying inflation model for years 2019 and after
-            if inflation_year <= year:
-                updated_total *= (1 + inflation_rate / 100)
-                updated_unit_price *= (1 + inflation_rate / 100)
-    
-    return updated_total, updated_unit_price
\ No newline at end of file
+
+    factor = index_factors(year, price_index, category)[0]
+    return average_total_2019 * factor, average_unit_price_2019 * factor
+
+def item_categories(sales_df, categories=None):
+    """
+    CPI category of every sales row. categories may be one category name, a {product line: category} mapping
+    (product_line_categories by default) or one category per row. Each distinct product line is mapped once;
+    lines missing from the mapping fall back to default_category with a warning.
+    """
+    categories = product_line_categories if categories is None else categories
+    if isinstance(categories, str):
+        return np.full(len(sales_df), categories, dtype=object)
+    if isinstance(categories, dict):
+        codes, lines = pd.factorize(sales_df['Product line'])
+        unmapped = [line for line in lines if line not in categories]
+        if unmapped:
+            message = f"No CPI category for product line(s) {', '.join(map(str, unmapped))}; using {default_category!r}"
+            logger.warning(message)
+            print(f"Warning: {message}")
+        # Rows without a product line (code -1) pick the default category appended at the end.
+        mapped = np.array([categories.get(line, default_category) for line in lines] + [default_category], dtype=object)
+        return mapped[codes]
+
+    categories = np.asarray(categories, dtype=object)
+    if len(categories) != len(sales_df):
+        raise ValueError(f"Expected one category per sales row ({len(sales_df)}), got {len(categories)}")
+    return categories
+
+def adjust_sales_prices(sales_df, years, price_index, categories=None, columns=None):
+    """
+    Re-express the base_year prices of every sales row in the given year's dollars, each row using the CPI
+    category of its product line. years may be one year or one per row. All rows are adjusted in one vectorized
+    index lookup. Returns one row per sale with its Invoice ID (when the data has one), Product line, Category,
+    year and the adjusted price columns ('Unit price' and 'Total' by default).
+    """
+    columns = columns or price_columns
+    row_categories = item_categories(sales_df, categories)
+    years = np.broadcast_to(np.asarray(years), (len(sales_df),))
+    factors = index_factors(years, price_index, row_categories)
+
+    identity = [column for column in ['Invoice ID', 'Product line'] if column in sales_df.columns]
+    adjusted = sales_df[identity].copy()
+    adjusted['Category'] = row_categories
+    adjusted['Year'] = years
+    for column in columns:
+        # Sales amounts are stored as float32; adjust them in full precision.
+        adjusted[f'Adjusted {column}'] = sales_df[column].to_numpy(dtype='float64') * factors
+    return adjusted
+
+def save_adjusted_prices(adjusted, file_path):
+    """Save per-sale adjusted prices in the configured storage format."""
+    return storage.save_dataset(adjusted, file_path)
+
+def adjust_sales_to_month(sales_df, target_month, monthly_index, categories=None, columns=None):
+    """
+    Re-express every sale's amounts ('Unit price', 'Total', 'cogs' and 'gross income' by default) in the dollars
+    of target_month (e.g. '2025-06'), each sale using the index of the month of its Date and the CPI category of
+    its product line.
+
+    The months of the sales are matched against the sorted monthly index with one binary search over all rows,
+    so millions of invoices cost a single vectorized merge instead of a lookup per row. target_month may also be
+    one month per row. Returns one row per sale with its Invoice ID (when the data has one), Product line, Date,
+    Category, target Period and the adjusted amounts.
+    """
+    columns = columns or amount_columns
+    row_categories = item_categories(sales_df, categories)
+
+    # Month numbers of the index (sorted, one per month) and of every sale.
+    index_months = periods.month_index(monthly_index.index.to_series()).to_numpy()
+    sale_months = periods.month_index(pd.to_datetime(sales_df['Date'])).to_numpy()
+    # Each distinct target month is parsed once.
+    if np.ndim(target_month) == 0:
+        target_codes, unique_targets = np.zeros(len(sales_df), dtype=int), [target_month]
+    else:
+        target_codes, unique_targets = pd.factorize(pd.Series(target_month))
+    unique_targets = pd.PeriodIndex([pd.Period(target, freq='M') for target in unique_targets], freq='M')
+    targets = unique_targets.take(target_codes)
+    target_months = periods.month_index(unique_targets.to_series()).to_numpy()[target_codes]
+
+    rows = {}
+    for name, months in [('sale', sale_months), ('target', target_months)]:
+        positions = np.searchsorted(index_months, months).clip(max=len(index_months) - 1)
+        missing = index_months[positions] != months
+        if missing.any():
+            first_missing = pd.Period(year=int(months[missing][0]) // 12, month=int(months[missing][0]) % 12 + 1, freq='M')
+            raise ValueError(f"No inflation data for the {name} month {first_missing} (the index covers "
+                             f"{monthly_index.index[0]} to {monthly_index.index[-1]})")
+        rows[name] = positions
+
+    # Each distinct category is looked up once.
+    codes, unique_categories = pd.factorize(row_categories)
+    category_columns = monthly_index.columns.get_indexer(unique_categories)
+    if (category_columns < 0).any():
+        raise ValueError(f"No inflation data for category(ies): {sorted(unique_categories[category_columns < 0].tolist())}")
+    columns_of_rows = category_columns[codes]
+
+    levels = monthly_index.to_numpy()
+    factors = levels[rows['target'], columns_of_rows] / levels[rows['sale'], columns_of_rows]
+
+    identity = [column for column in ['Invoice ID', 'Product line', 'Date'] if column in sales_df.columns]
+    adjusted = sales_df[identity].copy()
+    adjusted['Category'] = row_categories
+    adjusted['Period'] = targets
+    for column in columns:
+        adjusted[f'Adjusted {column}'] = sales_df[column].to_numpy(dtype='float64') * factors
+    return adjusted
@@ -0,0 +1,70 @@
+# benchmark.py
+# Compares the NumPy AR forecaster with the SARIMA path: time to fit and forecast every category, and
+# accuracy in a rolling-origin backtest. Usage: python benchmark.py [--data-dir data/] [--repeat 3]
+import sys
+import time
+import argparse
+import subprocess
+
+import numpy as np
+import pandas as pd
+
+import analysis.backtest as backtest
+import analysis.model_evaluation as model_evaluation
+import analysis.predict as predict
+import analysis.predict_AR as predict_AR
+
+# Categories forecast by the pipeline.
+categories = ['Food at home', 'Food Away from home', 'Food and Beverage']
+
+def import_seconds(module):
+    """Seconds a fresh interpreter takes to import a module."""
+    code = f'import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)'
+    return float(subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout)
+
+def time_sarima(data, steps):
+    """Fit SARIMA from scratch for every category (no model cache) and forecast steps months."""
+    start = time.perf_counter()
+    for category in categories:
+        model_fit = predict.fit_sarima_model(data, category, use_cache=False)
+        predict.forecast_inflation(model_fit, steps)
+    return time.perf_counter() - start
+
+def time_ar(data, steps):
+    """Fit the AR models of every category in one batch and forecast steps months."""
+    start = time.perf_counter()
+    predict_AR.forecast_ar(predict_AR.fit_ar_models(data, categories), steps)
+    return time.perf_counter() - start
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the NumPy AR forecaster against SARIMA.")
+    parser.add_argument('--data-dir', default='data/', help="directory holding inflation.csv (default: data/)")
+    parser.add_argument('--repeat', type=int, default=3, help="timing repetitions; the fastest is reported (default: 3)")
+    args = parser.parse_args(argv)
+    data_dir = args.data_dir if args.data_dir.endswith('/') else args.data_dir + '/'
+
+    data = predict.preprocess_data(predict.load_data(f'{data_dir}inflation.csv'))
+    steps = 84
+
+    print("Import time (fresh interpreter)")
+    print(f"  SARIMA (analysis.predict):  {import_seconds('analysis.predict'):.3f} s")
+    print(f"  AR (analysis.predict_AR):   {import_seconds('analysis.predict_AR'):.3f} s")
+
+    print(f"Fit and forecast {steps} months for {len(categories)} categories (best of {args.repeat})")
+    sarima_seconds = min(time_sarima(data, steps) for _ in range(args.repeat))
+    ar_seconds = min(time_ar(data, steps) for _ in range(args.repeat))
+    print(f"  SARIMA: {sarima_seconds:.3f} s")
+    print(f"  AR:     {ar_seconds:.5f} s ({sarima_seconds / ar_seconds:.0f}x faster)")
+
+    print("Rolling-origin backtest (RMSE by horizon, averaged over categories)")
+    start = time.perf_counter()
+    errors = backtest.run_backtest(data.reset_index(), categories, ['SARIMA', 'AR'])
+    metrics = model_evaluation.horizon_metrics(errors)
+    table = metrics.groupby(['Model', 'Horizon'])['RMSE'].mean().unstack()
+    table['All'] = errors.groupby('Model')['Error'].apply(lambda error: np.sqrt((error ** 2).mean()))
+    with pd.option_context('display.float_format', '{:.3f}'.format, 'display.width', 200):
+        print(table[[1, 3, 6, 12, 'All']])
+    print(f"  (backtest took {time.perf_counter() - start:.1f} s)")
+
+if __name__ == "__main__":
+    main()
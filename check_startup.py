@@ -0,0 +1,65 @@
+# check_startup.py
+# Guards the pipeline's startup time: imports main in a fresh interpreter with -X importtime and fails when one of
+# the heavy libraries is loaded at import time or the import takes longer than the budget.
+# Usage: python check_startup.py [--module main] [--budget 0.5] [--repeat 3]
+import re
+import sys
+import argparse
+import subprocess
+
+# Libraries that are only needed by some stages and must be imported on first use, not at startup.
+heavy_modules = ['statsmodels', 'sklearn', 'scipy', 'plotly', 'kaleido', 'requests']
+
+# Seconds the import of main may take. pandas and numpy alone account for most of it.
+default_budget = 0.5
+
+# Lines written by -X importtime: "import time: <self us> | <cumulative us> | <indented module name>".
+importtime_line = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)$')
+
+def import_profile(module):
+    """Import a module in a fresh interpreter and return {module name: cumulative seconds} for everything it loaded."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, check=True)
+    profile = {}
+    for line in result.stderr.splitlines():
+        match = importtime_line.match(line)
+        if match:
+            profile[match.group(4)] = int(match.group(2)) / 1e6
+    return profile
+
+def heavy_imports(profile):
+    """The heavy libraries (top-level package names) found in an import profile."""
+    loaded = {name.split('.')[0] for name in profile}
+    return [name for name in heavy_modules if name in loaded]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that importing the pipeline stays fast.")
+    parser.add_argument('--module', default='main', help="module to import (default: main)")
+    parser.add_argument('--budget', type=float, default=default_budget,
+                        help=f"maximum import time in seconds (default: {default_budget})")
+    parser.add_argument('--repeat', type=int, default=3, help="imports to time; the fastest is used (default: 3)")
+    args = parser.parse_args(argv)
+
+    profiles = [import_profile(args.module) for _ in range(args.repeat)]
+    profile = min(profiles, key=lambda profile: profile[args.module])
+    seconds = profile[args.module]
+
+    print(f"Importing {args.module} took {seconds:.3f} s (budget {args.budget:.3f} s, best of {args.repeat})")
+    slowest = sorted(profile.items(), key=lambda item: item[1], reverse=True)[1:6]
+    for name, cumulative in slowest:
+        print(f"  {name:<40} {cumulative:.3f} s")
+
+    failed = False
+    heavy = heavy_imports(profile)
+    if heavy:
+        print(f"FAIL: {args.module} imports {', '.join(heavy)} at startup; import them where they are used")
+        failed = True
+    if seconds > args.budget:
+        print(f"FAIL: import time is over the {args.budget:.3f} s budget")
+        failed = True
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,38 @@
 # bls_extract.py
 import os
-import requests
+import glob
+import time
+import hashlib
+import random
+import threading
 import json
+import email.utils
+import numpy as np
 import pandas as pd
-from datetime import datetime
+from datetime import date, timezone
+from concurrent.futures import ThreadPoolExecutor
+import etl.storage as storage
+
+# API URL for BLS Public Data API 1.0; this is a public API with no key required, but can be limited to only up to 25 calls a day.
+api_url = 'https://api.bls.gov/publicAPI/v1/timeseries/data/'
+
+# Limits of the public v1 API. Larger requests are split into chunks that respect them.
+max_series_per_request = 25
+max_years_per_request = 10
+daily_request_limit = 25
+
+# Successful responses are cached here for the rest of the day, keyed by the request payload.
+cache_dir = 'data/bls_cache/'
+
+# Monthly BLS periods ('M13' is the annual average).
+period_labels = [f'M{month:02}' for month in range(1, 14)]
+
+# HTTP status codes worth retrying: rate limiting and temporary server errors.
+retry_status_codes = {429, 500, 502, 503, 504}
+
+# Raised when a request would go over the daily request limit.
+class QuotaExceededError(RuntimeError):
+    pass
 
 # Function to set up the data directory
 def setup_data_directory(data_dir='data/'):
@@ -12,65 +41,337 @@ def setup_data_directory(data_dir='data/'):
 
     return data_dir
 
-# Function to fetch data from BLS API
-def fetch_bls_data(series_ids, start_year, end_year, start_month, end_month):
-    # API URL for BLS Public Data API 1.0; this is a public API with no key required, but can be limited to only up to 25 calls a day.
-    api_url = 'https://api.bls.gov/publicAPI/v1/timeseries/data/'
-    
-    # Series IDs for Food CPI. This was found online from this link: https://www.bls.gov/cpi/tables/relative-importance/weight-update-comparison-2023.htm
-    series_ids = ['CUUR0000SAF', 'CUUR0000SAF11', 'CUUR0000SEFV']
-
-    # Gets current date for active updating purposes.
-    now = datetime.now()
-    current_year = now.year
-    current_month = now.month
-
-    # Defines date range for API call. Keep in mind the API is limited to 10 years maximum, meaning that this may throw errors in the future.
-    start_year = 2014
-    end_year = current_year
-    start_month = 1
-    end_month = current_month
+# Function to split a request into chunks the API accepts: at most max_series_per_request series and
+# max_years_per_request years each. Returns a list of (series_ids, start_year, end_year) tuples.
+def chunk_requests(series_ids, start_year, end_year, series_per_request=None, years_per_request=None):
+    series_per_request = series_per_request or max_series_per_request
+    years_per_request = years_per_request or max_years_per_request
 
-    # Preparation for the request payload.
-    data = {
-        "seriesid": series_ids,
+    chunks = []
+    for i in range(0, len(series_ids), series_per_request):
+        for chunk_start in range(start_year, end_year + 1, years_per_request):
+            chunk_end = min(chunk_start + years_per_request - 1, end_year)
+            chunks.append((list(series_ids[i:i + series_per_request]), chunk_start, chunk_end))
+    return chunks
+
+# Function to create an HTTP session whose connection pool is shared by all concurrent requests.
+def create_session(pool_size=4):
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+# Function to read how many requests were made today. The count is kept in quota_file so it carries over between runs.
+quota_lock = threading.Lock()
+
+def quota_used(quota_file):
+    try:
+        with open(quota_file) as f:
+            quota = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    return quota.get('requests', 0) if quota.get('date') == date.today().isoformat() else 0
+
+# Function to count requests against the daily limit, raising QuotaExceededError once it is reached.
+def reserve_quota(quota_file, limit=None, requests_needed=1):
+    limit = daily_request_limit if limit is None else limit
+    if quota_file is None:
+        return
+
+    with quota_lock:
+        today = date.today().isoformat()
+        used = quota_used(quota_file)
+        if used + requests_needed > limit:
+            raise QuotaExceededError(f"BLS daily request limit reached ({used} of {limit} requests used today)")
+
+        quota = {'date': today, 'requests': used + requests_needed}
+        quota_dir = os.path.dirname(quota_file)
+        if quota_dir:
+            os.makedirs(quota_dir, exist_ok=True)
+        with open(quota_file, 'w') as f:
+            json.dump(quota, f)
+
+# Function to build the request payload.
+def request_payload(series_ids, start_year, end_year, start_month, end_month):
+    return {
+        "seriesid": list(series_ids),
         "startyear": str(start_year),
         "endyear": str(end_year),
         "startmonth": f'{start_month:02}',
         "endmonth": f'{end_month:02}'
     }
-    headers = {'Content-type': 'application/json'}
-    response = requests.post(api_url, data=json.dumps(data), headers=headers)
+
+# Function to get the cache file for a request. The file name includes today's date, so cached responses
+# are only reused on the day they were fetched.
+def cached_response_path(url, payload, directory=None):
+    directory = directory or cache_dir
+    key = hashlib.sha256(json.dumps([url, payload], sort_keys=True).encode()).hexdigest()
+    return os.path.join(directory, f'{date.today().isoformat()}_{key}.json')
+
+# Function to load a cached response, or None if the request has not been made today.
+def load_cached_response(path):
+    if not os.path.exists(path):
+        return None
+    import requests
+
+    response = requests.Response()
+    response.status_code = 200
+    with open(path, 'rb') as f:
+        response._content = f.read()
     return response
 
+# Function to check that a response is a successful API answer. A 200 response whose body is not JSON counts as failed.
+def request_succeeded(response):
+    if response.status_code != 200:
+        return False
+    try:
+        return response.json().get('status') == 'REQUEST_SUCCEEDED'
+    except (ValueError, AttributeError):
+        return False
+
+# Function to cache a successful response. Responses cached on earlier days are removed.
+def save_cached_response(path, response):
+    if not request_succeeded(response):
+        return
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(response.content)
+    os.replace(tmp_path, path)
+
+    today = date.today().isoformat()
+    for old_path in glob.glob(os.path.join(directory, '*.json')):
+        if not os.path.basename(old_path).startswith(today):
+            os.remove(old_path)
+
+# Function to read how many seconds a Retry-After header asks to wait. The header holds either a number of seconds
+# or an HTTP date; default (the backoff delay) is used when it is missing or cannot be parsed.
+def retry_after_seconds(value, default):
+    if value is None:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, retry_at.timestamp() - time.time())
+
+# Function to fetch data from BLS API. Temporary failures (connection errors, timeouts, HTTP 429 and 5xx) are
+# retried with exponential backoff; every attempt counts against the daily quota. A Retry-After header is honoured
+# up to the longest backoff delay (backoff * 2 ** retries), so a server cannot stall the extract for hours.
+# With use_cache, a request already answered today is served from the response cache without calling the API.
+def fetch_bls_data(series_ids, start_year, end_year, start_month, end_month, url=None, session=None,
+                   retries=3, backoff=1.0, timeout=30, quota_file=None, use_cache=False, response_cache_dir=None):
+    # requests is imported on first use, so the other pipeline stages do not pay for loading it.
+    import requests
+
+    url = url or api_url
+    session = session or requests
+
+    # Preparation for the request payload.
+    data = request_payload(series_ids, start_year, end_year, start_month, end_month)
+    headers = {'Content-type': 'application/json'}
+
+    if use_cache:
+        cache_path = cached_response_path(url, data, response_cache_dir)
+        response = load_cached_response(cache_path)
+        if response is not None:
+            return response
+
+    for attempt in range(retries + 1):
+        reserve_quota(quota_file)
+        try:
+            response = session.post(url, data=json.dumps(data), headers=headers, timeout=timeout)
+            if response.status_code not in retry_status_codes or attempt == retries:
+                if use_cache:
+                    save_cached_response(cache_path, response)
+                return response
+            delay = min(retry_after_seconds(response.headers.get('Retry-After'), backoff * 2 ** attempt), backoff * 2 ** retries)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt
+
+        # Jitter keeps concurrent retries from hitting the API at the same moment.
+        time.sleep(delay * (1 + random.random() / 2))
+
+# Function to fetch any number of series over any year range. The request is split into API-sized chunks that
+# are fetched concurrently over one pooled session, and the results are merged into a single DataFrame.
+def extract_bls_data(series_ids, start_year, end_year, start_month=1, end_month=12, url=None,
+                     max_workers=4, retries=3, backoff=1.0, timeout=30, quota_file=None,
+                     use_cache=False, response_cache_dir=None):
+    requests_to_make = [(chunk_series, chunk_start, chunk_end,
+                         start_month if chunk_start == start_year else 1,
+                         end_month if chunk_end == end_year else 12)
+                        for chunk_series, chunk_start, chunk_end in chunk_requests(series_ids, start_year, end_year)]
+
+    # Check up front that the whole extraction fits in today's quota, rather than failing halfway through.
+    # Requests that will be served from the response cache do not count.
+    if quota_file is not None:
+        needed = len(requests_to_make)
+        if use_cache:
+            needed -= sum(os.path.exists(cached_response_path(url or api_url, request_payload(*request), response_cache_dir))
+                          for request in requests_to_make)
+        used = quota_used(quota_file)
+        if used + needed > daily_request_limit:
+            raise QuotaExceededError(f"Extraction needs {needed} requests but only {daily_request_limit - used} remain today")
+
+    def fetch_chunk(request):
+        response = fetch_bls_data(*request, url, session, retries, backoff, timeout, quota_file,
+                                  use_cache, response_cache_dir)
+        df = process_response(response)
+        if df is None:
+            chunk_series, chunk_start, chunk_end = request[:3]
+            raise RuntimeError(f"BLS request for {len(chunk_series)} series, {chunk_start}-{chunk_end} failed")
+        return df
+
+    session = create_session(max_workers)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            frames = list(executor.map(fetch_chunk, requests_to_make))
+    finally:
+        session.close()
+
+    df = pd.concat(frames, ignore_index=True)
+
+    # The v1 API only filters by year, so trim monthly observations to the requested months.
+    month = pd.to_numeric(df['Period'].str[1:], errors='coerce')
+    key = df['Year'].astype(int) * 12 + month
+    in_range = month.gt(12) | key.between(start_year * 12 + start_month, end_year * 12 + end_month)
+    df = df[in_range | month.isna()]
+
+    # Keep the API's ordering: by series, newest observation first.
+    df = df.drop_duplicates(subset=['Series ID', 'Year', 'Period'], keep='last')
+    return df.sort_values(by=['Series ID', 'Year', 'Period'], ascending=[True, False, False], ignore_index=True)
+
+# Function to load the previously extracted data, or None on the first run.
+def load_existing_data(data_dir, filename='food_cpi_data.csv'):
+    try:
+        return storage.load_dataset(os.path.join(data_dir, filename))
+    except FileNotFoundError:
+        return None
+
+# Function to find the months each series still needs. Series already stored from start_year/start_month onwards
+# only need the months after their latest observation (the high-water mark); other series need the whole range.
+# Returns a dict mapping (start_year, start_month) to the series to fetch from that month.
+def missing_windows(existing, series_ids, start_year, end_year, start_month=1, end_month=12):
+    requested_start = start_year * 12 + start_month - 1
+    requested_end = end_year * 12 + end_month - 1
+
+    stored_first, stored_last = {}, {}
+    if existing is not None and not existing.empty:
+        month = pd.to_numeric(existing['Period'].astype(str).str[1:], errors='coerce')
+        monthly = existing[month.between(1, 12)]
+        key = (monthly['Year'].astype(int) * 12 + month[month.between(1, 12)] - 1).groupby(monthly['Series ID'].astype(str))
+        stored_first, stored_last = key.min().to_dict(), key.max().to_dict()
+
+    windows = {}
+    for series_id in series_ids:
+        first = requested_start
+        if stored_first.get(series_id, requested_start + 1) <= requested_start:
+            first = stored_last[series_id] + 1
+        if first <= requested_end:
+            windows.setdefault(divmod(first, 12), []).append(series_id)
+    return {(year, month + 1): ids for (year, month), ids in windows.items()}
+
+# Function to merge newly fetched rows into the existing data. New rows replace stored rows for the same month.
+def upsert_data(existing, new_data):
+    new_data = new_data.astype({'Year': int, 'Value': float})
+    if existing is None or existing.empty:
+        df = new_data
+    else:
+        existing = existing.astype({'Series ID': str, 'Year': int, 'Period': str, 'Value': float})
+        df = pd.concat([existing, new_data], ignore_index=True)
+    df = df.drop_duplicates(subset=['Series ID', 'Year', 'Period'], keep='last')
+    return df.sort_values(by=['Series ID', 'Year', 'Period'], ascending=[True, False, False], ignore_index=True)
+
+# Function to bring the stored data up to date, requesting only the months that are not stored yet.
+# Returns the updated data and the number of rows fetched.
+def update_bls_data(series_ids, start_year, end_year, start_month, end_month, data_dir, filename='food_cpi_data.csv', **kwargs):
+    existing = load_existing_data(data_dir, filename)
+    windows = missing_windows(existing, series_ids, start_year, end_year, start_month, end_month)
+
+    frames = [extract_bls_data(ids, window_year, end_year, window_month, end_month, **kwargs)
+              for (window_year, window_month), ids in sorted(windows.items())]
+    new_data = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['Series ID', 'Year', 'Period', 'Value'])
+    return upsert_data(existing, new_data), len(new_data)
+
+# Function to parse the observations in a BLS response body straight into typed column arrays.
+# Each observation is written to the arrays as soon as the decoder finishes it and then discarded, so no
+# per-observation dicts or rows are kept (their footnotes and 'latest' flag are dropped with them).
+# Returns the decoded response (with the observations removed) and the DataFrame.
+def parse_response_content(content):
+    # Every observation has exactly one "period" key, which bounds the number of rows.
+    capacity = content.count(b'"period"')
+    series_codes = np.empty(capacity, dtype=np.int32)
+    years = np.empty(capacity, dtype=np.int16)
+    months = np.empty(capacity, dtype=np.int8)
+    values = np.empty(capacity, dtype=np.float64)
+    series_ids = {}
+    rows = series_start = 0
+
+    def parse_object(obj):
+        nonlocal rows, series_start
+        if 'period' in obj and 'year' in obj:
+            period = obj['period']
+            # Monthly observations (M01-M12) and the annual average (M13) are kept, as the API returns them;
+            # the inflation stage drops the annual averages.
+            if period[:1] == 'M' and period[1:].isdigit() and 1 <= int(period[1:]) <= 13:
+                years[rows] = int(obj['year'])
+                months[rows] = int(period[1:])
+                try:
+                    values[rows] = float(obj['value'])
+                except (TypeError, ValueError):
+                    # Missing values are reported as '-'.
+                    values[rows] = np.nan
+                rows += 1
+            return None
+        if 'seriesID' in obj:
+            # A series is decoded after its observations, so the rows since the previous series belong to it.
+            series_codes[series_start:rows] = series_ids.setdefault(obj['seriesID'], len(series_ids))
+            series_start = rows
+            return None
+        return obj
+
+    json_data = json.loads(content, object_hook=parse_object)
+
+    df = pd.DataFrame({
+        'Series ID': pd.Categorical.from_codes(series_codes[:rows], categories=list(series_ids)),
+        'Year': years[:rows],
+        'Period': pd.Categorical.from_codes(months[:rows] - 1, categories=period_labels),
+        'Value': values[:rows]
+    }, copy=False)
+    return json_data, df
+
 # Function to process the response from BLS API
 def process_response(response):
     # Check response status and process data if the response is successful.
     if response.status_code == 200:
-        json_data = response.json()
-        if json_data['status'] == 'REQUEST_SUCCEEDED':
-            results = json_data['Results']['series']
-            all_data = []
-            
-            for series in results:
-                series_id = series['seriesID']
-                for item in series['data']:
-                    year = item['year']
-                    period = item['period']
-                    value = item['value']
-                    all_data.append([series_id, year, period, value])
-                    
-            # Convert to DataFrame for saving the file as a CSV.
-            return pd.DataFrame(all_data, columns=['Series ID', 'Year', 'Period', 'Value'])
+        try:
+            json_data, df = parse_response_content(response.content)
+        except ValueError as e:
+            print("API response is not valid JSON:", e)
+            return None
+        if json_data.get('status') == 'REQUEST_SUCCEEDED':
+            return df
         else:
-            print("API request failed:", json_data['message'])
+            print("API request failed:", json_data.get('message'))
             return None
     else:
         print("Request failed with status code", response.status_code)
         return None
 
-# Function to save the processed data to a CSV file
+# Function to save the processed data in the configured storage format (CSV by default)
 def save_data(df, data_dir, filename='food_cpi_data.csv'):
-    csv_file = os.path.join(data_dir, filename)
-    df.to_csv(csv_file, index=False)
-    print(f"Data saved to {csv_file}")
\ No newline at end of file
+    output_file = storage.save_dataset(df, os.path.join(data_dir, filename))
+    print(f"Data saved to {output_file}")
\ No newline at end of file
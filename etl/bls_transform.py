@@ -1,9 +1,9 @@
 # bls_transform.py
-import pandas as pd
+import etl.storage as storage
 
-# Function to load the CSV file
+# Function to load the extracted data
 def load_data(input_file):
-    df = pd.read_csv(input_file)
+    df = storage.load_dataset(input_file)
     return df
 
 # Function to rename columns
@@ -32,7 +32,7 @@ def map_period(df):
     df['Period'] = df['Period'].map(period_mapping)
     return df
 
-# Function to save the transformed data to a CSV file
+# Function to save the transformed data in the configured storage format
 def save_data(df, output_file):
-    df.to_csv(output_file, index=False)
+    output_file = storage.save_dataset(df, output_file)
     print(f"Data saved to {output_file}")
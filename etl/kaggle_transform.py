@@ -1,24 +1,53 @@
 # kaggle_transform.py
 import pandas as pd
+import etl.storage as storage
+import etl.schemas as schemas
 
-# Function to load the data from the CSV file
-def load_data(input_file):
-    df = pd.read_csv(input_file)
-    return df
+# Product lines kept by default, for better application in this project.
+product_lines = ['Food and beverages']
 
-# Function to filter the dataset to only include entries with 'Food and beverages' in the Product line for better application in this project.
-def filter_data(df):
-    filtered_df = df[df['Product line'] == 'Food and beverages']
+# Unneccessary demographic information regarding each data entry (not needed for the scope of this project.)
+# The Invoice ID is kept so that adjusted prices can be traced back to each sale.
+columns_to_remove = ['Branch', 'City', 'Customer type', 'Gender', 'Payment', 'Rating']
+
+# Rows read at a time by transform_data.
+chunk_size = 100000
+
+# Function to load the data from the CSV file with the compact types of its schema. The removed columns are skipped while parsing.
+# With chunksize, returns an iterator of DataFrames instead.
+def load_data(input_file, chunksize=None):
+    schema = schemas.dataset_schema(input_file)
+    reader = pd.read_csv(input_file, usecols=lambda column: column not in columns_to_remove,
+                         dtype=schemas.reader_dtypes(schema), chunksize=chunksize)
+    if chunksize is None:
+        return schemas.apply_schema(reader, schema)
+    return (schemas.apply_schema(chunk, schema) for chunk in reader)
+
+# Function to filter the dataset to only include entries in the given Product lines ('Food and beverages' by default).
+# lines can also be a function taking the Product line column and returning a boolean mask.
+def filter_data(df, lines=None):
+    lines = product_lines if lines is None else lines
+    if callable(lines):
+        mask = lines(df['Product line'])
+    else:
+        mask = df['Product line'].isin([lines] if isinstance(lines, str) else lines)
+    filtered_df = df[mask]
     return filtered_df
 
-# Function to remove the specified columns, which are unneccessary demographic information regarding each data entry 
-# (not needed for the scope of this project.)
+# Function to remove the specified columns
 def remove_columns(df):
-    columns_to_remove = ['Invoice ID', 'Branch', 'City', 'Customer type', 'Gender', 'Payment', 'Rating']
-    transformed_df = df.drop(columns=columns_to_remove)
+    transformed_df = df.drop(columns=columns_to_remove, errors='ignore')
     return transformed_df
 
-# Function to save the transformed data to a new CSV file
+# Function to transform the sales data in chunks: each chunk is filtered and appended to the output, so memory use
+# stays bounded however large the input is. Returns the number of rows written.
+def transform_data(input_file, output_file, lines=None, chunksize=None):
+    chunks = (remove_columns(filter_data(chunk, lines)) for chunk in load_data(input_file, chunksize or chunk_size))
+    output_file, rows = storage.save_dataset_chunks(chunks, output_file)
+    print(f"Data saved to: {output_file}")
+    return rows
+
+# Function to save the transformed data in the configured storage format
 def save_data(df, output_file):
-    df.to_csv(output_file, index=False)
+    output_file = storage.save_dataset(df, output_file)
     print(f"Data saved to: {output_file}")
\ No newline at end of file
@@ -0,0 +1,74 @@
+# periods.py
+import pandas as pd
+
+# Month names used when periods are written out as 'Month Year' text.
+month_names = ['January', 'February', 'March', 'April', 'May', 'June',
+               'July', 'August', 'September', 'October', 'November', 'December']
+
+# Periods are kept as a monthly pandas PeriodDtype throughout the pipeline. They are parsed once when a CSV
+# dataset is loaded and formatted as 'Month Year' text only when a dataset is written to CSV.
+period_dtype = pd.PeriodDtype(freq='M')
+
+def parse_periods(values):
+    """
+    Convert a column of periods to the monthly PeriodDtype.
+
+    Accepts 'Month Year' text (the CSV export format), ISO dates, datetimes or periods. Each distinct
+    value is parsed only once, so long columns with repeated months stay cheap.
+    """
+    if isinstance(values.dtype, pd.PeriodDtype):
+        return values.astype(period_dtype)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.dt.to_period('M')
+
+    codes, uniques = pd.factorize(values)
+    parsed = pd.to_datetime(pd.Series(uniques), format='%B %Y', errors='coerce')
+    # Fall back to general date parsing for values that are not 'Month Year' text, such as ISO dates.
+    unparsed = parsed.isna() & pd.Series(uniques).notna()
+    if unparsed.any():
+        parsed[unparsed] = pd.to_datetime(pd.Series(uniques)[unparsed])
+    parsed_periods = pd.Series(parsed.dt.to_period('M').array.take(codes, allow_fill=True), index=values.index)
+    return parsed_periods.astype(period_dtype)
+
+def read_periods(df, column='Period'):
+    """Convert a dataset's period column to the monthly PeriodDtype in place and return the dataset."""
+    df[column] = parse_periods(df[column])
+    return df
+
+def from_year_month(year, month):
+    """Build monthly periods from integer year and month columns."""
+    dates = pd.to_datetime(pd.DataFrame({'year': year, 'month': month, 'day': 1}))
+    return dates.dt.to_period('M')
+
+def drop_duplicate_months(df, column='Period'):
+    """
+    Keep one row per category and month. Predictive datasets list the historical rows of a category before its
+    forecast, so where both cover a month the historical value is kept.
+    """
+    return df.drop_duplicates(['Category', column], keep='first')
+
+def month_index(values):
+    """Integer month number (year * 12 + month - 1), convenient for arithmetic on periods."""
+    return values.dt.year * 12 + values.dt.month - 1
+
+def to_timestamps(values):
+    """Convert periods to month-start timestamps, e.g. for plotting."""
+    return values.dt.to_timestamp()
+
+def format_periods(values):
+    """Format periods as 'Month Year' text. Each distinct period is formatted only once."""
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(uniques)
+    labels = uniques.dt.month.map(lambda month: month_names[month - 1]) + ' ' + uniques.dt.year.astype(str)
+    # Missing periods have code -1, which reindex turns into NaN.
+    return pd.Series(labels.reindex(codes).to_numpy(), index=values.index)
+
+def format_period_columns(df):
+    """Return a copy of the dataset with every period column formatted as 'Month Year' text."""
+    period_columns = [column for column in df.columns if isinstance(df[column].dtype, pd.PeriodDtype)]
+    if not period_columns:
+        return df
+    df = df.copy()
+    for column in period_columns:
+        df[column] = format_periods(df[column])
+    return df
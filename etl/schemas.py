@@ -0,0 +1,138 @@
+# schemas.py
+import os
+import pandas as pd
+import etl.periods as periods
+
+# Compact column types for every dataset in the pipeline, keyed by file name without the extension.
+# Besides pandas dtypes, 'period' is a monthly period, 'date' a calendar date and 'time' a time of day (stored as
+# the time since midnight). Low-cardinality text is categorical, and float32 is only used for money amounts
+# with a few decimals, which it holds exactly enough.
+bls_periods = pd.CategoricalDtype([f'M{month:02}' for month in range(1, 14)], ordered=True)
+month_names = pd.CategoricalDtype(periods.month_names, ordered=True)
+
+inflation_schema = {'Period': 'period', 'Category': 'category', 'Inflation Rate': 'float64'}
+
+sales_schema = {
+    'Invoice ID': 'object',
+    'Branch': 'category',
+    'City': 'category',
+    'Customer type': 'category',
+    'Gender': 'category',
+    'Product line': 'category',
+    'Unit price': 'float32',
+    'Quantity': 'int16',
+    'Tax 5%': 'float32',
+    'Total': 'float32',
+    'Date': 'date',
+    'Time': 'time',
+    'Payment': 'category',
+    'cogs': 'float32',
+    'gross margin percentage': 'float64',
+    'gross income': 'float32',
+    'Rating': 'float32'
+}
+
+adjusted_prices_schema = {
+    'Invoice ID': 'object',
+    'Product line': 'category',
+    'Category': 'category',
+    'Year': 'int16',
+    'Adjusted Unit price': 'float64',
+    'Adjusted Total': 'float64'
+}
+
+adjusted_sales_schema = {
+    'Invoice ID': 'object',
+    'Product line': 'category',
+    'Date': 'date',
+    'Category': 'category',
+    'Period': 'period',
+    'Adjusted Unit price': 'float64',
+    'Adjusted Total': 'float64',
+    'Adjusted cogs': 'float64',
+    'Adjusted gross income': 'float64'
+}
+
+schemas = {
+    'food_cpi_data': {'Series ID': 'category', 'Year': 'int16', 'Period': bls_periods, 'Value': 'float64'},
+    'transformed_food_cpi_data': {'Category': 'category', 'Year': 'int16', 'Period': month_names, 'CPI': 'float64'},
+    'inflation': inflation_schema,
+    'forecasted_inflation': inflation_schema,
+    'predictive_inflation': inflation_schema,
+    'predictive_inflation_ARIMA': inflation_schema,
+    'predictive_inflation_LinReg': inflation_schema,
+    'predictive_inflation_AR': inflation_schema,
+    'supermarket_sales': sales_schema,
+    'transformed_supermarket_sales': sales_schema,
+    'adjusted_prices': adjusted_prices_schema,
+    'adjusted_sales': adjusted_sales_schema
+}
+
+# Types that need parsing after the file is read rather than a dtype passed to the reader.
+parsed_types = {'period', 'date', 'time'}
+
+def dataset_schema(path):
+    """Look up the schema of a dataset from its file name. Returns an empty schema for unknown datasets."""
+    name, _ = os.path.splitext(os.path.basename(path))
+    return schemas.get(name, {})
+
+def reader_dtypes(schema):
+    """The part of a schema that read_csv can apply while parsing."""
+    return {column: dtype for column, dtype in schema.items() if not isinstance(dtype, str) or dtype not in parsed_types}
+
+def parse_dates(values):
+    """Convert a column of dates to datetime64. Each distinct value is parsed only once."""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    codes, uniques = pd.factorize(values)
+    parsed = pd.Series(pd.to_datetime(pd.Series(uniques)).array.take(codes, allow_fill=True), index=values.index)
+    return parsed.astype('datetime64[ns]')
+
+def parse_times(values):
+    """Convert 'HH:MM' or 'HH:MM:SS' times of day to the time since midnight. Each distinct value is parsed only once."""
+    if pd.api.types.is_timedelta64_dtype(values):
+        return values
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(uniques).astype(str)
+    uniques = uniques.where(uniques.str.count(':') != 1, uniques + ':00')
+    parsed = pd.Series(pd.to_timedelta(uniques).array.take(codes, allow_fill=True), index=values.index)
+    return parsed.astype('timedelta64[ns]')
+
+def format_times(values):
+    """Format times of day as 'HH:MM', adding ':SS' only when there are seconds. Each distinct time is formatted only once."""
+    codes, uniques = pd.factorize(values)
+    components = pd.Series(uniques).dt.components
+    labels = components['hours'].map('{:02}'.format) + ':' + components['minutes'].map('{:02}'.format)
+    labels = labels.where(components['seconds'] == 0, labels + ':' + components['seconds'].map('{:02}'.format))
+    return pd.Series(labels.reindex(codes).to_numpy(), index=values.index)
+
+def apply_schema(df, schema):
+    """Convert the dataset's columns to the types in the schema. Columns missing from the dataset are ignored."""
+    for column, dtype in schema.items():
+        if column not in df.columns:
+            continue
+        if dtype == 'period':
+            df[column] = periods.parse_periods(df[column])
+        elif dtype == 'date':
+            df[column] = parse_dates(df[column])
+        elif dtype == 'time':
+            df[column] = parse_times(df[column])
+        elif df[column].dtype != dtype:
+            df[column] = df[column].astype(dtype)
+
+        # Categories read from Parquet/Arrow keep their order of appearance. Sorting them keeps sorts and
+        # groupbys on the column in the same order as for plain text.
+        if isinstance(dtype, str) and dtype == 'category' and not df[column].cat.categories.is_monotonic_increasing:
+            df[column] = df[column].cat.reorder_categories(df[column].cat.categories.sort_values())
+    return df
+
+def format_columns(df):
+    """Return a copy of the dataset with periods and times formatted as text for CSV output."""
+    df = periods.format_period_columns(df)
+    time_columns = [column for column in df.columns if pd.api.types.is_timedelta64_dtype(df[column])]
+    if not time_columns:
+        return df
+    df = df.copy()
+    for column in time_columns:
+        df[column] = format_times(df[column])
+    return df
@@ -0,0 +1,134 @@
+# storage.py
+import os
+import pandas as pd
+import etl.schemas as schemas
+
+# File format used for the intermediate datasets passed between stages: 'csv', 'parquet' or 'arrow' (Arrow IPC/Feather).
+# Paths are always given with a .csv extension and mapped to the configured format.
+storage_format = 'csv'
+
+# When the format is not CSV, also write a CSV copy of every saved dataset for people and tools that need one.
+export_csv = False
+
+# File extension used for each format.
+format_extensions = {'csv': '.csv', 'parquet': '.parquet', 'arrow': '.arrow'}
+
+# Low-cardinality text columns stored as categoricals in the binary formats when a dataset has no schema.
+categorical_columns = ['Series ID', 'Category', 'Product line']
+
+def set_format(fmt, csv_export=False):
+    """Select the storage format for intermediate datasets. The binary formats require pyarrow."""
+    global storage_format, export_csv
+    if fmt not in format_extensions:
+        raise ValueError(f"Unknown storage format: {fmt}. Choose from {', '.join(format_extensions)}.")
+    if fmt != 'csv':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError(f"The {fmt} storage format requires pyarrow (pip install pyarrow).")
+    storage_format = fmt
+    export_csv = csv_export
+
+def dataset_path(path, fmt=None):
+    """Map a dataset's .csv path to the file used by the given (or configured) format."""
+    root, _ = os.path.splitext(path)
+    return root + format_extensions[fmt or storage_format]
+
+def to_storage_types(df, schema=None):
+    """Convert the dataset to the compact types of its schema, or store the known low-cardinality text columns as categoricals."""
+    df = df.reset_index(drop=True)
+    if schema:
+        return schemas.apply_schema(df, schema)
+    for column in categorical_columns:
+        if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype('category')
+    return df
+
+def save_dataset(df, path, fmt=None):
+    """Save a dataset in the given (or configured) format and return the path written."""
+    fmt = fmt or storage_format
+    output_path = dataset_path(path, fmt)
+
+    if fmt == 'csv':
+        # Periods (and times) are only turned into text here, at the CSV export boundary.
+        schemas.format_columns(df).to_csv(output_path, index=False)
+        return output_path
+
+    df = to_storage_types(df, schemas.dataset_schema(path))
+    if fmt == 'parquet':
+        df.to_parquet(output_path, index=False)
+    else:
+        df.to_feather(output_path)
+
+    if export_csv:
+        schemas.format_columns(df).to_csv(dataset_path(path, 'csv'), index=False)
+    return output_path
+
+def save_dataset_chunks(chunks, path, fmt=None):
+    """
+    Save a dataset arriving as an iterable of DataFrames, writing each chunk as it comes so only one chunk
+    is held in memory. Returns the path written and the number of rows.
+    """
+    fmt = fmt or storage_format
+    output_path = dataset_path(path, fmt)
+    csv_path = dataset_path(path, 'csv') if fmt == 'csv' or export_csv else None
+    schema = schemas.dataset_schema(path)
+    writer, rows, first = None, 0, None
+
+    try:
+        for chunk in chunks:
+            if first is None:
+                first = chunk
+            # Chunks without rows carry no type information, so the first non-empty chunk fixes the schema.
+            if chunk.empty:
+                continue
+            chunk = to_storage_types(chunk, schema)
+
+            if csv_path:
+                schemas.format_columns(chunk).to_csv(csv_path, index=False, mode='a' if rows else 'w', header=not rows)
+
+            if fmt != 'csv':
+                import pyarrow as pa
+                if fmt == 'arrow':
+                    # The Arrow file format cannot change a dictionary between batches, and each chunk has its own
+                    # categories, so categoricals are written as plain text and restored from the schema on load.
+                    chunk = chunk.astype({column: object for column in chunk.columns
+                                          if isinstance(chunk[column].dtype, pd.CategoricalDtype)})
+                if writer is None:
+                    arrow_schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+                    if fmt == 'parquet':
+                        import pyarrow.parquet as pq
+                        writer = pq.ParquetWriter(output_path, arrow_schema)
+                    else:
+                        writer = pa.ipc.new_file(output_path, arrow_schema)
+                writer.write_table(pa.Table.from_pandas(chunk, schema=arrow_schema, preserve_index=False))
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    # Nothing was written, so save the (empty) dataset in one go to still produce a file with the columns.
+    if not rows:
+        save_dataset(first if first is not None else pd.DataFrame(), path, fmt)
+    return output_path, rows
+
+def load_dataset(path, fmt=None, columns=None, schema=None):
+    """
+    Load a dataset saved with save_dataset. Arrow files are memory-mapped rather than parsed.
+    Falls back to the CSV version when the dataset has not been written in the configured format yet.
+    Columns are converted to the types in schema, which defaults to the dataset's entry in the schema registry.
+    """
+    fmt = fmt or storage_format
+    schema = schemas.dataset_schema(path) if schema is None else schema
+    input_path = dataset_path(path, fmt)
+    if fmt != 'csv' and not os.path.exists(input_path) and os.path.exists(dataset_path(path, 'csv')):
+        fmt, input_path = 'csv', dataset_path(path, 'csv')
+
+    if fmt == 'csv':
+        df = pd.read_csv(input_path, usecols=columns, dtype=schemas.reader_dtypes(schema))
+    elif fmt == 'parquet':
+        df = pd.read_parquet(input_path, columns=columns, memory_map=True)
+    else:
+        import pyarrow.feather as feather
+        df = feather.read_table(input_path, columns=columns, memory_map=True).to_pandas()
+    return schemas.apply_schema(df, schema)
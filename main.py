@@ -1,39 +1,68 @@
 import os
+import sys
+import json
+import argparse
 import logging
 from datetime import datetime
 import etl.bls_extract as bls_extract
 import etl.bls_transform as bls_transform
 import etl.kaggle_transform as kaggle_transform
+import etl.storage as storage
+import etl.periods as periods
 
 import pandas as pd
 import analysis.inflation as inflation
 import analysis.predict as predict
 import analysis.predict_ARIMA as predict_ARIMA
 import analysis.predict_LinReg as predict_LinReg
+import analysis.predict_AR as predict_AR
 import analysis.model_evaluation as model_evaluation
 import analysis.price_forecast as price_forecast
+import analysis.fit_scheduler as fit_scheduler
+import analysis.order_search as order_search
+import analysis.backtest as backtest
+import pipeline
 
 import vis.inflationvis as inflationvis
 import vis.supermarket_forecast as supermarket_forecast
+import vis.render as render
+import vis.downsample as downsample
 
-# Logging configuration.
-logging.basicConfig(filename='app.log', level=logging.INFO, 
-                    format='%(asctime)s - %(levelname)s - %(message)s')
+# Logging configuration, applied when the pipeline runs so that importing this module has no side effects.
+log_file = 'app.log'
+
+def configure_logging():
+    """Send the pipeline's log to log_file."""
+    logging.basicConfig(filename=log_file, level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+logger = logging.getLogger()
+
+# List of categories forecasted by every model.
+categories = ['Food at home', 'Food Away from home', 'Food and Beverage']
+
+# Models that can be run, in the order they are offered to the user.
+model_names = ['sarima', 'arima', 'linreg', 'ar']
+
+# Year range supported by the price and COGS forecasts.
+first_year = 2014
+last_year = 2030
+
+# Formats the figures are saved in by default: the inflation chart as PNG, the COGS projections as HTML.
+inflation_figure_formats = ['png']
+cogs_figure_formats = ['html']
 
-def main():
-    logger = logging.getLogger()
-    logging.basicConfig(level=logging.INFO)
-    
 #-----------------------------------------------------------------------------------#
 
-    # ETL Scripts. Run sequentially.
-    # Run bls_extract.py.
+# ETL Scripts. Run sequentially.
+def run_bls_extract(data_dir):
+    """Run bls_extract.py. Returns True if the stage succeeded."""
     try:
         logger.info("Starting bls_extract.py")
-        
+
         # Set up the data directory
-        data_dir = bls_extract.setup_data_directory()
-        
+        data_dir = bls_extract.setup_data_directory(data_dir)
+
         # Series IDs for Food CPI. This was found online from this link: https://www.bls.gov/cpi/tables/relative-importance/weight-update-comparison-2023.htm
         series_ids = ['CUUR0000SAF', 'CUUR0000SAF11', 'CUUR0000SEFV']
 
@@ -42,33 +71,41 @@ def main():
         current_year = now.year
         current_month = now.month
 
-        # Defines date range for API call. Keep in mind the API is limited to 10 years maximum, meaning that this may throw errors in the future.
+        # Defines date range for API call. Ranges longer than the API's 10 year limit are split into several requests.
         start_year = 2014
         end_year = current_year
         start_month = 1
         end_month = current_month
 
-        # Fetch data from BLS API.
-        response = bls_extract.fetch_bls_data(series_ids, start_year, end_year, start_month, end_month)
-    
-        # Process response and save data if successful
-        if response:
-            df = bls_extract.process_response(response)
-            if df is not None:
-                bls_extract.save_data(df, data_dir)
+        # Fetch only the months missing from the stored data, keeping track of the daily request limit and
+        # caching responses in the data directory.
+        quota_file = os.path.join(data_dir, '.bls_quota.json')
+        df, new_rows = bls_extract.update_bls_data(series_ids, start_year, end_year, start_month, end_month, data_dir,
+                                                   quota_file=quota_file, use_cache=True,
+                                                   response_cache_dir=os.path.join(data_dir, 'bls_cache'))
+        print(f"Fetched {new_rows} new rows from the BLS API")
+
+        # Only rewrite the stored data when it changed, so the stages reading it stay fresh.
+        if new_rows or not os.path.exists(storage.dataset_path(os.path.join(data_dir, 'food_cpi_data.csv'))):
+            bls_extract.save_data(df, data_dir)
+        else:
+            print("BLS data is already up to date")
 
         logger.info("Completed bls_extract.py")
+        return True
     except Exception as e:
         logger.error(f"Error in bls_extract.py: {e}")
-    
-    # Run bls_transform.py.
+        return False
+
+def run_bls_transform(data_dir):
+    """Run bls_transform.py. Returns True if the stage succeeded."""
     try:
         logger.info("Starting bls_transform.py")
 
         # Defining the file paths for the data to be pulled/stored.
-        input_file = 'data/food_cpi_data.csv'
-        output_file = 'data/transformed_food_cpi_data.csv'
-        
+        input_file = f'{data_dir}food_cpi_data.csv'
+        output_file = f'{data_dir}transformed_food_cpi_data.csv'
+
         # Loads the CSV file.
         df = bls_transform.load_data(input_file)
 
@@ -85,336 +122,661 @@ def main():
         bls_transform.save_data(df, output_file)
 
         logger.info("Completed bls_transform.py")
+        return True
     except Exception as e:
         logger.error(f"Error in bls_transform.py: {e}")
+        return False
 
-    # Run kaggle_transform.py.
+def run_inflation(data_dir):
+    """Run inflation.py to turn the transformed CPI data into monthly inflation rates. Returns True if the stage succeeded."""
+    try:
+        logger.info("Starting inflation.py")
+
+        # Defining the file paths for the data to be pulled/stored.
+        input_file = f'{data_dir}transformed_food_cpi_data.csv'
+        output_file = f'{data_dir}inflation.csv'
+
+        df = inflation.load_data(input_file)
+        df, _ = inflation.map_months(df)
+        df = inflation.clean_data(df)
+        inflation_df = inflation.calculate_inflation(df)
+        inflation.save_data(inflation_df, output_file)
+
+        logger.info("Completed inflation.py")
+        return True
+    except Exception as e:
+        logger.error(f"Error in inflation.py: {e}")
+        return False
+
+def run_kaggle_transform(data_dir, product_lines=None, chunk_size=None):
+    """Run kaggle_transform.py. Returns True if the stage succeeded."""
     try:
         logger.info("Starting kaggle_transform.py")
 
         # Defining the file paths for the data to be pulled/stored.
-        input_file = 'data/supermarket_sales.csv'
-        output_file = 'data/transformed_supermarket_sales.csv'
-        
-        # Load the data from the CSV file
-        df = kaggle_transform.load_data(input_file)
-        
-        # Filter the data to only include 'Food and beverages' entries
-        df = kaggle_transform.filter_data(df)
-        
-        # Remove unnecessary columns
-        df = kaggle_transform.remove_columns(df)
-        
-        # Save the transformed data to a new CSV file
-        kaggle_transform.save_data(df, output_file)
-        print("Data saved to: ", output_file)
+        input_file = f'{data_dir}supermarket_sales.csv'
+        output_file = f'{data_dir}transformed_supermarket_sales.csv'
+
+        # Read the sales data in chunks, keep the selected product lines ('Food and beverages' by default)
+        # without the unnecessary columns, and append each chunk to the output file.
+        kaggle_transform.transform_data(input_file, output_file, product_lines, chunk_size)
 
         logger.info("Completed kaggle_transform.py")
+        return True
     except Exception as e:
         logger.error(f"Error in kaggle_transform.py: {e}")
+        return False
 
 #-----------------------------------------------------------------------------------#
 
-    # Analysis Scripts. Runs based off user input.
-    # Prompt user to select a predictive model
+# Analysis Scripts.
+def prompt_model():
+    """Prompt the user to select a predictive model."""
     print("Select a predictive model to use:")
     print("1. SARIMA: Seasonal Autoregressive Integrated Moving-Average model, most commonly used for time series forecasting. This one is most recommended for this project.")
     print("2. ARIMA: Autoregressive Integrated Moving-Average model, similar to SARIMA but without the seasonal component.")
     print("3. Linear Regression: A simple linear model that assumes a linear relationship between the input and output variables.")
-
-    model_choice = input("Enter the number corresponding to your choice (1, 2, or 3): ")
-
-    while model_choice not in ['1', '2', '3']:
-        print("Invalid choice. Please enter 1, 2, or 3.")
-        model_choice = input("Enter the number corresponding to your choice (1, 2, or 3): ")
-
-    data_dir = 'data/'
+    print("4. Fast AR: An autoregressive model over the last 12 months, fitted without statsmodels. Much faster than SARIMA, useful for quick what-if runs.")
+
+    model_choice = input("Enter the number corresponding to your choice (1, 2, 3, or 4): ")
+
+    while model_choice not in ['1', '2', '3', '4']:
+        print("Invalid choice. Please enter 1, 2, 3, or 4.")
+        model_choice = input("Enter the number corresponding to your choice (1, 2, 3, or 4): ")
+
+    return model_names[int(model_choice) - 1]
+
+def prepare_sarima(historical_file_path):
+    """Load the SARIMA input data and the future dates to forecast until December 2030."""
+    data = predict.load_data(historical_file_path)
+    data = predict.preprocess_data(data)
+
+    # Generate the future months to forecast until December 2030
+    last_date = data.index[-1]
+    future_dates = pd.period_range(start=last_date + 1, end='2030-12', freq='M')
+    return data, future_dates
+
+def prepare_arima(historical_file_path):
+    """Load the ARIMA input data and the future dates to forecast until December 2030."""
+    data = predict_ARIMA.load_data(historical_file_path)
+    data = predict_ARIMA.preprocess_data(data)
+
+    # Generate the future months to forecast until December 2030
+    last_date = data.index[-1]
+    future_dates = pd.period_range(start=last_date + 1, end='2030-12', freq='M')
+    return data, future_dates
+
+def prepare_ar(historical_file_path):
+    """Load the AR input data and the future dates to forecast until December 2030."""
+    data = predict_AR.load_data(historical_file_path)
+    data = predict_AR.preprocess_data(data)
+
+    # Generate the future months to forecast until December 2030
+    last_date = data.index[-1]
+    future_dates = pd.period_range(start=last_date + 1, end='2030-12', freq='M')
+    return data, future_dates
+
+def prepare_linreg(historical_file_path):
+    """Load the Linear Regression input data and the future dates to forecast until December 2030."""
+    data = predict_LinReg.load_data(historical_file_path)
+
+    # Convert 'Period' column to monthly periods
+    data = periods.read_periods(data)
+
+    # Convert periods to numeric values
+    data = predict_LinReg.convert_periods_to_numeric(data)
+
+    # Determine the number of months to forecast until December 2030
+    last_date = data['Period'].max()
+    end_date = pd.Period('2030-12', freq='M')
+    future_dates = predict_LinReg.generate_future_dates(last_date, end_date)
+    return data, future_dates
+
+def save_sarima(data_dir, historical_file_path, data, all_forecasts):
+    """Save the SARIMA forecasts and the combined historical and forecasted data."""
+    forecasted_file_path = f'{data_dir}forecasted_inflation.csv'
+    output_file_path = f'{data_dir}predictive_inflation.csv'
+
+    # Save the forecasted data to CSV
+    forecasted_df = pd.concat(all_forecasts, ignore_index=True)
+    saved_path = predict.save_forecast_to_csv(forecasted_df, forecasted_file_path)
+    print("Forecasted data saved to: ", saved_path)
+
+    # Merge historical and forecasted data and save to CSV
+    saved_path = predict.merge_and_save_data(historical_file_path, forecasted_file_path, output_file_path)
+    print("Predictive data (both historical and forecasted combined) saved to: ", saved_path)
+
+def save_arima(data_dir, historical_file_path, data, all_forecasts):
+    """Save the ARIMA forecasts and the combined historical and forecasted data."""
+    forecasted_file_path = f'{data_dir}forecasted_inflation.csv'
+    eval_file_path = f'{data_dir}predictive_inflation_ARIMA.csv'
+    output_file_path = f'{data_dir}predictive_inflation.csv'
+
+    # Combine all forecasts into a single DataFrame
+    all_forecasts_df = pd.concat(all_forecasts, ignore_index=True)
+
+    # Save combined forecasts to a CSV file
+    saved_path = predict_ARIMA.save_forecast_to_csv(all_forecasts_df, forecasted_file_path)
+    print("Forecasted data saved to: ", saved_path)
+
+    # Merge historical and forecasted data, sort, and save
+    saved_path = predict_ARIMA.merge_and_save_data(historical_file_path, forecasted_file_path, output_file_path)
+    predict_ARIMA.merge_and_save_data(historical_file_path, forecasted_file_path, eval_file_path)
+    print("Predictive data (both historical and forecasted combined) saved to: ", saved_path)
+
+def save_linreg(data_dir, historical_file_path, data, all_forecasts):
+    """Save the Linear Regression forecasts and the combined historical and forecasted data."""
+    forecasted_file_path = f'{data_dir}forecasted_inflation.csv'
+    eval_file_path = f'{data_dir}predictive_inflation_LinReg.csv'
+    output_file_path = f'{data_dir}predictive_inflation.csv'
+
+    # Combine all forecasts into a single DataFrame
+    all_forecasts_df = pd.concat(all_forecasts, ignore_index=True)
+
+    # Save combined forecasts to a CSV file
+    saved_path = predict_LinReg.save_data(all_forecasts_df, forecasted_file_path)
+    print("Forecasted data saved to: ", saved_path)
+
+    # Merge historical and forecasted data, sort, and save
+    merged_data = predict_LinReg.merge_data(data, all_forecasts_df)
+    saved_path = predict_LinReg.save_data(merged_data, output_file_path)
+    predict_LinReg.save_data(merged_data, eval_file_path)
+    print("Predictive data (both historical and forecasted combined) saved to: ", saved_path)
+
+def save_ar(data_dir, historical_file_path, data, all_forecasts):
+    """Save the AR forecasts and the combined historical and forecasted data."""
+    forecasted_file_path = f'{data_dir}forecasted_inflation.csv'
+    eval_file_path = f'{data_dir}predictive_inflation_AR.csv'
+    output_file_path = f'{data_dir}predictive_inflation.csv'
+
+    # Combine all forecasts into a single DataFrame
+    all_forecasts_df = pd.concat(all_forecasts, ignore_index=True)
+
+    # Save combined forecasts to a CSV file
+    saved_path = predict_AR.save_forecast_to_csv(all_forecasts_df, forecasted_file_path)
+    print("Forecasted data saved to: ", saved_path)
+
+    # Merge historical and forecasted data, sort, and save
+    saved_path = predict_AR.merge_and_save_data(historical_file_path, forecasted_file_path, output_file_path)
+    predict_AR.merge_and_save_data(historical_file_path, forecasted_file_path, eval_file_path)
+    print("Predictive data (both historical and forecasted combined) saved to: ", saved_path)
+
+# How each model is prepared and saved, and the scheduler name of its forecasting function.
+model_stages = {
+    'sarima': ('SARIMA', 'predict.py', prepare_sarima, save_sarima),
+    'arima': ('ARIMA', 'predict_ARIMA.py', prepare_arima, save_arima),
+    'linreg': ('LinReg', 'predict_LinReg.py', prepare_linreg, save_linreg),
+    'ar': ('AR', 'predict_AR.py', prepare_ar, save_ar)
+}
+
+def run_models(models, data_dir, max_workers=None, fit_timeout=None, search_orders=False, criterion=None):
+    """
+    Fit and save the selected models. Returns True if every model succeeded.
+
+    The category fits of all selected models are submitted to the process pool together. Models are
+    saved in the order given, so the last one listed provides predictive_inflation.csv.
+    With search_orders, the SARIMA and ARIMA orders of each category are searched again first; otherwise
+    the orders from the last search (or the defaults) are used.
+    """
     historical_file_path = f'{data_dir}inflation.csv'
-    categories = ['Food at home', 'Food Away from home', 'Food and Beverage']  # List of categories
+    orders_file = os.path.join(data_dir, 'model_orders.json')
+    cache_dir = os.path.join(data_dir, 'model_cache')
+    prepared = []
+    success = True
 
-    if model_choice == '1':
-        # Run SARIMA analysis
+    for model in models:
+        scheduler_name, script, prepare, save = model_stages[model]
         try:
-            logger.info("Starting SARIMA analysis (predict.py)")
-
-            forecasted_file_path = f'{data_dir}forecasted_inflation.csv'
-            output_file_path = f'{data_dir}predictive_inflation.csv'
-
-            data = predict.load_data(historical_file_path)
-            data = predict.preprocess_data(data)
-            
-            all_forecasts = []
-
-            # Determine the number of months to forecast until December 2030
-            last_date = data.index[-1]
-            end_date = pd.Timestamp('2030-12-01')
-            steps = (end_date.year - last_date.year) * 12 + (end_date.month - last_date.month)
-
-            for category in categories:
-                print(f"Processing category: {category}")
-                model_fit = predict.fit_sarima_model(data, category)
-                forecast = predict.forecast_inflation(model_fit, steps)
-                
-                # Generate future dates for the forecast
-                future_dates = [last_date + pd.DateOffset(months=i) for i in range(1, len(forecast) + 1)]
-                
-                # Prepare the forecasted data for saving
-                forecast_data = {
-                    'Period': future_dates,
-                    'Category': category,
-                    'Inflation Rate': forecast
-                }
-                all_forecasts.append(pd.DataFrame(forecast_data))
-
-            # Save the forecasted data to CSV
-            forecasted_df = pd.concat(all_forecasts, ignore_index=True)
-            predict.save_forecast_to_csv(forecasted_df, forecasted_file_path)
-            print("Forecasted data saved to: ", forecasted_file_path)
-
-            # Merge historical and forecasted data and save to CSV
-            predict.merge_and_save_data(historical_file_path, forecasted_file_path, output_file_path)
-            print("Predictive data (both historical and forecasted combined) saved to: ", output_file_path)
-
-            logger.info("Completed SARIMA analysis (predict.py)")
+            logger.info(f"Starting {scheduler_name} analysis ({script})")
+            data, future_dates = prepare(historical_file_path)
+            prepared.append((model, data, future_dates))
         except Exception as e:
-            logger.error(f"Error in predict.py: {e}")
+            logger.error(f"Error in {script}: {e}")
+            success = False
+
+    # Search the orders of the ARIMA-type models, keeping them for later runs.
+    if search_orders:
+        for model, data, future_dates in prepared:
+            scheduler_name = model_stages[model][0]
+            if scheduler_name not in order_search.search_limits:
+                continue
+            try:
+                chosen = order_search.select_orders(scheduler_name, data, categories, orders_file, criterion, max_workers, cache_dir)
+                for category, (order, seasonal_order, score) in chosen.items():
+                    print(f"{scheduler_name} orders for {category}: {order} {seasonal_order or ''} ({criterion or order_search.default_criterion} {score:.2f})")
+            except Exception as e:
+                logger.error(f"Error searching {scheduler_name} orders: {e}")
+                success = False
+
+    # Fit each category in parallel; forecasts come back in model and category order. Fitted parameters and
+    # searched orders are kept in the data directory.
+    jobs = [(model_stages[model][0], category, data, future_dates)
+            for model, data, future_dates in prepared for category in categories]
+    try:
+        all_forecasts = fit_scheduler.run_forecasts(jobs, max_workers, fit_timeout, cache_dir, orders_file)
+    except Exception as e:
+        logger.error(f"Error fitting models: {e}")
+        return False
 
-    elif model_choice == '2':
-        # Run ARIMA prediction analysis
+    for i, (model, data, future_dates) in enumerate(prepared):
+        scheduler_name, script, prepare, save = model_stages[model]
         try:
-            logger.info("Starting ARIMA analysis (predict_ARIMA.py)")
-
-            forecasted_file_path = f'{data_dir}forecasted_inflation.csv'
-            eval_file_path = f'{data_dir}predictive_inflation_ARIMA.csv'
-            output_file_path = f'{data_dir}predictive_inflation.csv'
-
-            data = predict_ARIMA.load_data(historical_file_path)
-            data = predict_ARIMA.preprocess_data(data)
-            
-            all_forecasts = []
-
-            # Determine the number of months to forecast until December 2030
-            last_date = data.index[-1]
-            end_date = pd.Timestamp('2030-12-01')
-            steps = (end_date.year - last_date.year) * 12 + (end_date.month - last_date.month)
-
-            for category in categories:
-                print(f"Processing category: {category}")
-                model_fit = predict_ARIMA.fit_arima_model(data, category)
-                forecast = predict_ARIMA.forecast_inflation(model_fit, steps)
-                
-                # Generate future dates for the forecast
-                future_dates = [last_date + pd.DateOffset(months=i) for i in range(1, len(forecast) + 1)]
-                
-                # Prepare the forecasted data for saving
-                forecast_data = {
-                    'Period': future_dates,
-                    'Category': category,
-                    'Inflation Rate': forecast
-                }
-                all_forecasts.append(pd.DataFrame(forecast_data))
-            
-            # Combine all forecasts into a single DataFrame
-            all_forecasts_df = pd.concat(all_forecasts, ignore_index=True)
-            
-            # Save combined forecasts to a CSV file
-            predict_ARIMA.save_forecast_to_csv(all_forecasts_df, forecasted_file_path)
-            print("Forecasted data saved to: ", forecasted_file_path)    
-
-            # Merge historical and forecasted data, sort, and save
-            predict_ARIMA.merge_and_save_data(historical_file_path, forecasted_file_path, output_file_path)
-            predict_ARIMA.merge_and_save_data(historical_file_path, forecasted_file_path, eval_file_path)   
-            print("Predictive data (both historical and forecasted combined) saved to: ", output_file_path)
-
-            logger.info("Completed ARIMA analysis (predict_ARIMA.py)")
+            save(data_dir, historical_file_path, data, all_forecasts[i * len(categories):(i + 1) * len(categories)])
+            logger.info(f"Completed {scheduler_name} analysis ({script})")
         except Exception as e:
-            logger.error(f"Error in predict_ARIMA.py: {e}")
+            logger.error(f"Error in {script}: {e}")
+            success = False
 
-    elif model_choice == '3':
-        # Run Linear Regression analysis
-        try:
-            logger.info("Starting Linear Regression Analysis (predict_LinReg.py)")
-
-            forecasted_file_path = f'{data_dir}forecasted_inflation.csv'
-            eval_file_path = f'{data_dir}predictive_inflation_LinReg.csv'
-            output_file_path = f'{data_dir}predictive_inflation.csv'
-
-            data = predict_LinReg.load_data(historical_file_path)
-            
-            # Convert 'Period' column to datetime
-            data['Period'] = pd.to_datetime(data['Period'], format='%B %Y')
-            
-            # Convert periods to numeric values
-            data = predict_LinReg.convert_periods_to_numeric(data)
-            
-            all_forecasts = []
-
-            # Determine the number of months to forecast until December 2030
-            last_date = data['Period'].max()
-            end_date = pd.Timestamp('2030-12-01')
-            future_dates = predict_LinReg.generate_future_dates(last_date, end_date)
-
-            for category in categories:
-                print(f"Processing category: {category}")
-                category_df = data[data['Category'] == category]
-                forecast = predict_LinReg.predict_inflation(category_df, future_dates)
-                
-                # Prepare the forecasted data for saving
-                forecast_data = {
-                    'Period': future_dates,
-                    'Category': category,
-                    'Inflation Rate': forecast
-                }
-                all_forecasts.append(pd.DataFrame(forecast_data))
-            
-            # Combine all forecasts into a single DataFrame
-            all_forecasts_df = pd.concat(all_forecasts, ignore_index=True)
-            
-            # Save combined forecasts to a CSV file
-            predict_LinReg.save_data(all_forecasts_df, forecasted_file_path)
-            print("Forecasted data saved to: ", forecasted_file_path)
-
-            # Merge historical and forecasted data, sort, and save
-            merged_data = predict_LinReg.merge_data(data, all_forecasts_df)
-            predict_LinReg.save_data(merged_data, output_file_path)
-            predict_LinReg.save_data(merged_data, eval_file_path)
-            print("Predictive data (both historical and forecasted combined) saved to: ", output_file_path)
-
-            logger.info("Completed Linear Regression Analysis (predict_LinReg.py)")
-        except Exception as e:
-            logger.error(f"Error in predict_LinReg.py: {e}")
+    return success
 
-    # Ask the user if they want to run evaluation metrics
+def prompt_evaluation():
+    """Ask the user if they want to run evaluation metrics."""
     while True:
-        run_evaluation = input("Do you want to run evaluation metrics? NOTE: You must run all 3 models before you can properly run evaluation metrics. (Y/N): ").upper()
+        run_evaluation = input("Do you want to run evaluation metrics? This backtests all 3 models on the historical data. (Y/N): ").upper()
         if run_evaluation in ['Y', 'N']:
-            break
+            return run_evaluation == 'Y'
         else:
             print("Invalid input. Please enter 'Y' for Yes or 'N' for No.")
 
-    if run_evaluation == 'Y':
-        # Run model_evaluation.py.
-        try:
-            logger.info("Starting model_evaluation.py")
-
-            data_dir = 'c:/Users/Matthew/Documents/INST414/data/'
-            
-            historical_file_path = f'{data_dir}inflation.csv'
-            forecasted_file_paths = [
-                f'{data_dir}predictive_inflation.csv',  # SARIMA
-                f'{data_dir}predictive_inflation_LinReg.csv',  # Linear Regression
-                f'{data_dir}predictive_inflation_ARIMA.csv'  # ARIMA
-            ]
-            metrics_output_paths = [
-                f'{data_dir}metrics_sarima.csv',
-                f'{data_dir}metrics_linreg.csv',
-                f'{data_dir}metrics_arima.csv'
-            ]
-            
-            historical_data = model_evaluation.load_data(historical_file_path)['Inflation Rate']
-            
-            for forecasted_file_path, metrics_output_path in zip(forecasted_file_paths, metrics_output_paths):
-                forecasted_data = model_evaluation.load_data(forecasted_file_path)['Inflation Rate']
-                
-                # Align data lengths
-                historical_data_aligned, forecasted_data_aligned = model_evaluation.align_data_lengths(historical_data, forecasted_data)
-                
-                metrics = model_evaluation.calculate_metrics(historical_data_aligned, forecasted_data_aligned)
-                model_evaluation.save_metrics_to_csv(metrics, metrics_output_path)
-
-            logger.info("Completed model_evaluation.py")
-        except Exception as e:
-            logger.error(f"Error in model_evaluation.py: {e}")
-    else:
-        print("Skipping evaluation metrics.")
+def run_evaluation(data_dir, max_workers=None):
+    """Run model_evaluation.py with a rolling-origin backtest of every model. Returns True if the stage succeeded."""
+    try:
+        logger.info("Starting model_evaluation.py")
+
+        historical_file_path = f'{data_dir}inflation.csv'
+        metrics_output_paths = {
+            'SARIMA': f'{data_dir}metrics_sarima.csv',
+            'LinReg': f'{data_dir}metrics_linreg.csv',
+            'ARIMA': f'{data_dir}metrics_arima.csv'
+        }
+
+        historical_data = model_evaluation.load_data(historical_file_path)
+
+        # Forecast from every month after the first training window, using only the data before it,
+        # and compare with what actually happened.
+        errors = backtest.run_backtest(historical_data, categories, list(metrics_output_paths), max_workers=max_workers,
+                                       orders_file=os.path.join(data_dir, 'model_orders.json'))
+
+        # Overall metrics per model, over every category and horizon.
+        for model_name, metrics_output_path in metrics_output_paths.items():
+            model_errors = errors[errors['Model'] == model_name]
+            metrics = model_evaluation.calculate_metrics(model_errors['Actual'], model_errors['Forecast'])
+            model_evaluation.save_metrics_to_csv(metrics, metrics_output_path)
 
-    #Run price_forecast.py.
+        model_evaluation.save_horizon_metrics_to_csv(model_evaluation.horizon_metrics(errors), f'{data_dir}metrics_by_horizon.csv')
+
+        logger.info("Completed model_evaluation.py")
+        return True
+    except Exception as e:
+        logger.error(f"Error in model_evaluation.py: {e}")
+        return False
+
+def prompt_year():
+    """Ask the user for the year to forecast prices for."""
+    while True:
+        try:
+            input_year = int(input(f"Enter a desired year between {first_year} and {last_year} for inflation forecasting: "))
+            if first_year <= input_year <= last_year:
+                return input_year
+            else:
+                print(f"Invalid input. Please enter a year between {first_year} and {last_year}.")
+        except ValueError:
+            print("Invalid input. Please enter a valid year.")
+
+def run_price_forecast(data_dir, years=None, target_month=None):
+    """
+    Run price_forecast.py for each year, prompting for one when years is None. Every sale's prices adjusted to
+    each year are saved to adjusted_prices.csv. With target_month, every sale's amounts are also re-expressed in
+    that month's dollars from the month of the sale and saved to adjusted_sales.csv.
+    Returns True if the stage succeeded.
+    """
     try:
         logger.info("Starting price_forecast.py")
 
         # Load the data
-        sales_df, inflation_df = price_forecast.load_data()
-        
+        sales_df, inflation_df = price_forecast.load_data(data_dir)
+
         # Calculate averages
         average_total_2019, average_unit_price_2019 = price_forecast.calculate_averages(sales_df)
 
-        # Get user input
         print("-----------------------------------")
         print("Price Forecasting: Example of Inflation Adjustment")
         print(f"The average total of food and beverage in 2019 based off of supermarket data was ${average_total_2019:.2f}.")
         print(f"The average unit price of food and beverage in 2019 based off of supermarket data was ${average_unit_price_2019:.2f}.")
 
-        while True:
-            try:
-                input_year = int(input("Enter a desired year between 2014 and 2030 for inflation forecasting: "))
-                if 2014 <= input_year <= 2030:
-                    break
-                else:
-                    print("Invalid input. Please enter a year between 2014 and 2030.")
-            except ValueError:
-                print("Invalid input. Please enter a valid year.")
-
-        # Adjust prices
-        updated_total, updated_unit_price = price_forecast.adjust_price(input_year, inflation_df, average_total_2019, average_unit_price_2019)
-        
-        # Output results
-        print(f"The new average total of food and beverage in {input_year} is: ${updated_total:.2f}")
-        print(f"The new average unit price of food and beverage in {input_year} is: ${updated_unit_price:.2f}")
+        # Get user input
+        if years is None:
+            years = [prompt_year()]
+
+        # Build the cumulative price index once; each year is then a single lookup
+        price_index = price_forecast.build_price_index(inflation_df)
+
+        adjusted = []
+        for input_year in years:
+            # Adjust prices
+            updated_total, updated_unit_price = price_forecast.adjust_price(input_year, price_index, average_total_2019, average_unit_price_2019)
+
+            # Output results
+            print(f"The new average total of food and beverage in {input_year} is: ${updated_total:.2f}")
+            print(f"The new average unit price of food and beverage in {input_year} is: ${updated_unit_price:.2f}")
+
+            # Adjust every sale with the CPI category of its product line
+            adjusted.append(price_forecast.adjust_sales_prices(sales_df, input_year, price_index))
+
+        if adjusted:
+            output_file = price_forecast.save_adjusted_prices(pd.concat(adjusted, ignore_index=True), f'{data_dir}adjusted_prices.csv')
+            print(f"Adjusted prices of every sale saved to: {output_file}")
+
+        if target_month is not None:
+            # Match each sale's month against the monthly index built once for all sales
+            monthly_index = price_forecast.build_monthly_index(inflation_df)
+            adjusted_sales = price_forecast.adjust_sales_to_month(sales_df, target_month, monthly_index)
+            output_file = price_forecast.save_adjusted_prices(adjusted_sales, f'{data_dir}adjusted_sales.csv')
+            print(f"Sales in {target_month.strftime('%B %Y')} dollars saved to: {output_file}")
 
         logger.info("Completed price_forecast.py")
+        return True
     except Exception as e:
         logger.error(f"Error in price_forecast.py: {e}")
+        return False
 
 #-----------------------------------------------------------------------------------#
 
-    # Visualization Scripts. Run Sequentially.
-    # Run inflationvis.py.
+# Visualization Scripts. Run Sequentially.
+def run_inflation_vis(data_dir, output_file='predictive_inflation_rate_by_category.png', show=True, max_points=None, method=None):
+    """
+    Run inflationvis.py. output_file may be a list of files, one per format. With max_points, each category's
+    trace is downsampled to that many points. Returns True if the stage succeeded.
+    """
     try:
         logger.info("Starting inflationvis.py")
 
-        data_dir = 'c:/Users/Matthew/Documents/INST414/data/'
         file_path = f'{data_dir}predictive_inflation.csv'
-        
+
         # Load data
         df = inflationvis.load_data(file_path)
-        
+
         # Plot the inflation data
-        inflationvis.plot_inflation_data(df)
+        inflationvis.plot_inflation_data(df, output_file, show, max_points=max_points, method=method)
 
         logger.info("Completed inflationvis.py")
+        return True
     except Exception as e:
         logger.error(f"Error in inflationvis.py: {e}")
-
-    # Run supermarket_forecast.py.
+        return False
+
+def run_supermarket_forecast(data_dir, scenarios=None, output_dir=None, show=True, formats=None):
+    """
+    Run supermarket_forecast.py for each (initial_cogs, start_year, start_month) scenario, prompting for one
+    when scenarios is None. When output_dir is given, each projection is saved there as CSV, and its figure in
+    each of formats (default: HTML). The figures of all scenarios are exported together at the end.
+    Returns True if the stage succeeded.
+    """
     try:
         logger.info("Starting supermarket_forecast.py")
 
         # Get user input
-        initial_cogs, start_year, start_month = supermarket_forecast.get_user_input()
-        
+        if scenarios is None:
+            scenarios = [supermarket_forecast.get_user_input()]
+
         # Load data
-        inflation_df, sales_df = supermarket_forecast.load_data()
-        
+        inflation_df, sales_df = supermarket_forecast.load_data(data_dir)
+
         # Calculate average gross margin
         avg_gross_margin = supermarket_forecast.calculate_average_gross_margin(sales_df)
 
-        # Create a date range for the forecasting period.
-        date_range = pd.date_range(start='2014-02-01', end='2030-12-01', freq='MS')
-        forecast_df = pd.DataFrame({'Date': date_range})
-        forecast_df['Year'] = forecast_df['Date'].dt.year
-        forecast_df['Month'] = forecast_df['Date'].dt.month
-
-        # Apply inflation/deflation to the projected COGS
-        forecast_df = supermarket_forecast.apply_inflation_deflation(forecast_df, inflation_df, initial_cogs, start_year, start_month)
-        start_date = pd.to_datetime(f'{start_year}-{start_month:02d}-01')
-
-        # Visualize the data
-        supermarket_forecast.visualize_data(forecast_df, initial_cogs, start_date, avg_gross_margin)
+        jobs = []
+        for initial_cogs, start_year, start_month in scenarios:
+            # Create a date range for the forecasting period.
+            date_range = pd.date_range(start='2014-02-01', end='2030-12-01', freq='MS')
+            forecast_df = pd.DataFrame({'Date': date_range})
+            forecast_df['Year'] = forecast_df['Date'].dt.year
+            forecast_df['Month'] = forecast_df['Date'].dt.month
+
+            # Apply inflation/deflation to the projected COGS
+            forecast_df = supermarket_forecast.apply_inflation_deflation(forecast_df, inflation_df, initial_cogs, start_year, start_month)
+            start_date = pd.to_datetime(f'{start_year}-{start_month:02d}-01')
+
+            forecast_df = supermarket_forecast.add_gross_income(forecast_df, avg_gross_margin)
+
+            # Save the projection and queue its figure for rendering
+            output_files = []
+            if output_dir:
+                name = os.path.join(output_dir, f'projected_cogs_{initial_cogs:g}_{start_year}_{start_month:02d}')
+                output_files = [f'{name}.{fmt}' for fmt in formats or cogs_figure_formats]
+                forecast_df.to_csv(f'{name}.csv', index=False)
+            job = supermarket_forecast.render_job(forecast_df, initial_cogs, start_date, output_files)
+
+            # Visualize the data, keeping the figure for the export
+            if show:
+                fig, job = render.prebuilt(job)
+                fig.show()
+            jobs.append(job)
+
+        # Export every scenario's figures in one pass
+        render.render_figures(jobs)
 
         logger.info("Completed supermarket_forecast.py")
+        return True
     except Exception as e:
         logger.error(f"Error in supermarket_forecast.py: {e}")
+        return False
+
+#-----------------------------------------------------------------------------------#
+
+# Command line options.
+def parse_cogs(value):
+    """Parse an 'initial_cogs,start_year,start_month' scenario."""
+    try:
+        initial_cogs, start_year, start_month = value.split(',') if isinstance(value, str) else value
+        scenario = (float(initial_cogs), int(start_year), int(start_month))
+    except (TypeError, ValueError):
+        raise argparse.ArgumentTypeError(f"invalid COGS scenario {value!r}, expected initial_cogs,start_year,start_month")
+    if not first_year <= scenario[1] <= last_year or not 1 <= scenario[2] <= 12:
+        raise argparse.ArgumentTypeError(f"COGS scenario {value!r} must start between {first_year} and {last_year}, month 1 to 12")
+    return scenario
+
+def parse_month(value):
+    """Parse a 'YYYY-MM' month."""
+    try:
+        month = pd.Period(str(value), freq='M')
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid month {value!r}, expected YYYY-MM")
+    if not first_year <= month.year <= last_year:
+        raise argparse.ArgumentTypeError(f"month {value!r} must be between {first_year} and {last_year}")
+    return month
+
+def build_parser():
+    """Build the command line parser."""
+    parser = argparse.ArgumentParser(
+        description="Food inflation pipeline. Runs interactively unless --batch is given.")
+    parser.add_argument('--config', help="JSON file whose keys match the long option names (e.g. {\"models\": [\"sarima\"], \"years\": [2025]}). Command line options override it.")
+    parser.add_argument('--batch', action='store_true', help="run every stage without prompting")
+    parser.add_argument('--models', nargs='+', choices=model_names, help="models to run in batch mode (default: sarima); the last one provides predictive_inflation.csv")
+    parser.add_argument('--evaluate', action='store_true', help="run evaluation metrics in batch mode")
+    parser.add_argument('--years', nargs='+', type=int, default=[], help=f"years ({first_year}-{last_year}) to forecast prices for in batch mode")
+    parser.add_argument('--target-month', type=parse_month, metavar='YYYY-MM',
+                        help="in batch mode, also re-express every sale's amounts in this month's dollars (saved to adjusted_sales.csv)")
+    parser.add_argument('--cogs', action='append', type=parse_cogs, default=[], metavar='COGS,YEAR,MONTH',
+                        help="COGS projection scenario for batch mode; may be repeated")
+    parser.add_argument('--output-dir', default='data/', help="directory holding the pipeline data and outputs (default: data/)")
+    parser.add_argument('--skip-extract', action='store_true', help="reuse the existing food_cpi_data.csv instead of calling the BLS API")
+    parser.add_argument('--force', action='store_true', help="in batch mode, rerun stages even if their outputs are up to date")
+    parser.add_argument('--storage-format', choices=list(storage.format_extensions), default='csv',
+                        help="file format for intermediate datasets; parquet and arrow need pyarrow (default: csv)")
+    parser.add_argument('--export-csv', action='store_true', help="also write CSV copies of intermediate datasets when using parquet or arrow")
+    parser.add_argument('--workers', type=int, help="processes used to fit models (default: CPU count)")
+    parser.add_argument('--fit-timeout', type=float, help="seconds to wait for each category's fit (default: no limit)")
+    parser.add_argument('--search-orders', action='store_true', help="search the SARIMA/ARIMA orders of each category again before fitting (the chosen orders are kept for later runs)")
+    parser.add_argument('--criterion', choices=['aic', 'bic'], help=f"information criterion for the order search (default: {order_search.default_criterion})")
+    parser.add_argument('--product-lines', nargs='+', help="product lines kept from the sales data (default: 'Food and beverages')")
+    parser.add_argument('--figure-formats', nargs='+', choices=render.figure_formats,
+                        help="formats every figure is exported in during batch mode, e.g. png svg html (default: png for the inflation chart, html for COGS projections)")
+    parser.add_argument('--max-points', type=int, help="downsample each trace of the inflation chart to at most this many points (default: plot every point)")
+    parser.add_argument('--downsample', choices=list(downsample.methods),
+                        help=f"downsampling method used with --max-points: lttb keeps the line's shape, minmax each bucket's extremes (default: {downsample.default_method})")
+    parser.add_argument('--chunk-size', type=int, help=f"rows of sales data processed at a time (default: {kaggle_transform.chunk_size})")
+    return parser
+
+def parse_args(argv=None):
+    """Parse the command line, using the --config file for any option that is not given."""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.config:
+        try:
+            with open(args.config) as f:
+                config = json.load(f)
+        except (OSError, ValueError) as e:
+            parser.error(f"could not read config file {args.config}: {e}")
+
+        options = {action.dest for action in parser._actions} - {'help', 'config'}
+        config = {key.replace('-', '_'): value for key, value in config.items()}
+        unknown = set(config) - options
+        if unknown:
+            parser.error(f"unknown options in config file: {', '.join(sorted(unknown))}")
+        if 'cogs' in config:
+            try:
+                config['cogs'] = [parse_cogs(scenario) for scenario in config['cogs']]
+            except argparse.ArgumentTypeError as e:
+                parser.error(str(e))
+        parser.set_defaults(**config)
+        args = parser.parse_args(argv)
+
+    if args.models and any(model not in model_names for model in args.models):
+        parser.error(f"models must be chosen from {', '.join(model_names)}")
+    try:
+        args.years = [int(year) for year in args.years]
+    except (TypeError, ValueError):
+        parser.error("years must be whole numbers")
+    if any(not first_year <= year <= last_year for year in args.years):
+        parser.error(f"years must be between {first_year} and {last_year}")
+
+    if args.chunk_size is not None and args.chunk_size < 1:
+        parser.error("chunk size must be at least 1")
+    if args.max_points is not None and args.max_points < downsample.min_points:
+        parser.error(f"max points must be at least {downsample.min_points}")
+
+    data_dir = args.output_dir
+    args.output_dir = data_dir if data_dir.endswith(('/', os.sep)) else data_dir + '/'
+    return args
+
+def build_stages(args):
+    """Declare the batch pipeline stages with the data files each one reads and writes."""
+    data_dir = args.output_dir
+    models = args.models or ['sarima']
+    path = lambda name: f'{data_dir}{name}'
+
+    # Intermediate datasets are stored in the configured format (e.g. inflation.parquet instead of inflation.csv).
+    dataset = lambda name: storage.dataset_path(path(name))
+
+    # Files written by the model stage: every model writes the forecast and predictive files,
+    # ARIMA, Linear Regression and AR also keep a copy for evaluation.
+    model_outputs = [dataset('forecasted_inflation.csv'), dataset('predictive_inflation.csv')]
+    if 'arima' in models:
+        model_outputs.append(dataset('predictive_inflation_ARIMA.csv'))
+    if 'linreg' in models:
+        model_outputs.append(dataset('predictive_inflation_LinReg.csv'))
+    if 'ar' in models:
+        model_outputs.append(dataset('predictive_inflation_AR.csv'))
+
+    # Orders chosen by the order search, which the backtest uses as well.
+    orders_file = path('model_orders.json')
+    if args.search_orders:
+        model_outputs.append(orders_file)
+
+    # Files written by the price forecast stage.
+    price_outputs = [dataset('adjusted_prices.csv')] if args.years else []
+    if args.target_month is not None:
+        price_outputs.append(dataset('adjusted_sales.csv'))
+
+    # Figures are written in every format asked for.
+    inflation_figures = [path(f'predictive_inflation_rate_by_category.{fmt}')
+                         for fmt in args.figure_formats or inflation_figure_formats]
+
+    stages = [
+        pipeline.Stage('bls_extract', lambda: run_bls_extract(data_dir),
+                       [], [dataset('food_cpi_data.csv')], always=True),
+        pipeline.Stage('bls_transform', lambda: run_bls_transform(data_dir),
+                       [dataset('food_cpi_data.csv')], [dataset('transformed_food_cpi_data.csv')]),
+        pipeline.Stage('inflation', lambda: run_inflation(data_dir),
+                       [dataset('transformed_food_cpi_data.csv')], [dataset('inflation.csv')]),
+        pipeline.Stage('kaggle_transform', lambda: run_kaggle_transform(data_dir, args.product_lines, args.chunk_size),
+                       [path('supermarket_sales.csv')], [dataset('transformed_supermarket_sales.csv')],
+                       key=(args.product_lines, kaggle_transform.columns_to_remove)),
+        pipeline.Stage('models', lambda: run_models(models, data_dir, args.workers, args.fit_timeout, args.search_orders, args.criterion),
+                       [dataset('inflation.csv')], model_outputs, key=models, always=args.search_orders),
+        pipeline.Stage('price_forecast', lambda: run_price_forecast(data_dir, args.years, args.target_month),
+                       [dataset('transformed_supermarket_sales.csv'), dataset('predictive_inflation.csv')],
+                       price_outputs, key=(args.years, str(args.target_month))),
+        pipeline.Stage('inflationvis', lambda: run_inflation_vis(data_dir, inflation_figures, False, args.max_points, args.downsample),
+                       [dataset('predictive_inflation.csv')], inflation_figures, key=(args.max_points, args.downsample))
+    ]
+
+    if args.skip_extract:
+        stages = stages[1:]
+
+    if args.evaluate:
+        stages.append(pipeline.Stage(
+            'model_evaluation', lambda: run_evaluation(data_dir, args.workers),
+            [dataset('inflation.csv'), orders_file],
+            [path('metrics_sarima.csv'), path('metrics_linreg.csv'), path('metrics_arima.csv'), path('metrics_by_horizon.csv')]))
+
+    if args.cogs:
+        cogs_formats = args.figure_formats or cogs_figure_formats
+        cogs_outputs = [path(f'projected_cogs_{initial_cogs:g}_{start_year}_{start_month:02d}.{extension}')
+                        for initial_cogs, start_year, start_month in args.cogs for extension in ['csv'] + cogs_formats]
+        stages.append(pipeline.Stage(
+            'supermarket_forecast', lambda: run_supermarket_forecast(data_dir, args.cogs, data_dir, show=False, formats=cogs_formats),
+            [dataset('transformed_supermarket_sales.csv'), dataset('predictive_inflation.csv')], cogs_outputs))
+
+    return stages
+
+def main(argv=None):
+    """Run the pipeline. Returns 0 when every stage succeeded and 1 otherwise."""
+    args = parse_args(argv)
+    configure_logging()
+    data_dir = args.output_dir
+
+    try:
+        storage.set_format(args.storage_format, args.export_csv)
+    except (ValueError, ImportError) as e:
+        print(e)
+        return 2
+
+    if args.batch:
+        # Log to the console as well so scheduled runs capture progress.
+        logger.addHandler(logging.StreamHandler())
+
+        # Stages run as soon as their inputs are ready and are skipped when their outputs are already up to date.
+        success = pipeline.run_pipeline(build_stages(args), f'{data_dir}.pipeline_state.json', force=args.force)
+        return 0 if success else 1
+
+    results = []
+
+    # ETL Scripts. Run sequentially.
+    if not args.skip_extract:
+        results.append(run_bls_extract(data_dir))
+    results.append(run_bls_transform(data_dir))
+    results.append(run_inflation(data_dir))
+    results.append(run_kaggle_transform(data_dir, args.product_lines, args.chunk_size))
+
+    # Analysis Scripts. Runs based off user input.
+    results.append(run_models([prompt_model()], data_dir, args.workers, args.fit_timeout, args.search_orders, args.criterion))
+
+    if prompt_evaluation():
+        results.append(run_evaluation(data_dir, args.workers))
+    else:
+        print("Skipping evaluation metrics.")
+
+    results.append(run_price_forecast(data_dir))
+
+    # Visualization Scripts. Run Sequentially.
+    results.append(run_inflation_vis(data_dir))
+    results.append(run_supermarket_forecast(data_dir))
+
+    return 0 if all(results) else 1
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,116 @@
+# pipeline.py
+import os
+import json
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+# A pipeline stage. run takes no arguments and returns True on success.
+# inputs and outputs are file paths; a stage depends on every stage that produces one of its inputs.
+# key describes the stage's parameters (e.g. which models to fit), so changing them makes the stage stale.
+# Stages with always=True, or without outputs, run every time.
+Stage = namedtuple('Stage', ['name', 'run', 'inputs', 'outputs', 'key', 'always'], defaults=[None, False])
+
+def stage_dependencies(stages):
+    """Map each stage name to the names of the stages producing its inputs."""
+    producers = {}
+    for stage in stages:
+        for output in stage.outputs:
+            if output in producers:
+                raise ValueError(f"{output} is produced by both {producers[output]} and {stage.name}")
+            producers[output] = stage.name
+
+    return {stage.name: {producers[path] for path in stage.inputs if path in producers} - {stage.name}
+            for stage in stages}
+
+def load_state(state_file):
+    """Load the parameter keys recorded for each stage's last successful run."""
+    try:
+        with open(state_file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_state(state_file, state):
+    """Save the parameter keys recorded for each stage's last successful run."""
+    tmp_file = f'{state_file}.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, state_file)
+
+def is_fresh(stage, state):
+    """A stage is fresh when all its outputs exist, are newer than its inputs and were built with the same key."""
+    if stage.always or not stage.outputs:
+        return False
+    if state.get(stage.name) != repr(stage.key):
+        return False
+    if not all(os.path.exists(path) for path in stage.outputs):
+        return False
+
+    oldest_output = min(os.path.getmtime(path) for path in stage.outputs)
+    input_times = [os.path.getmtime(path) for path in stage.inputs if os.path.exists(path)]
+    return not input_times or max(input_times) <= oldest_output
+
+def run_pipeline(stages, state_file, max_workers=None, force=False):
+    """
+    Run the stages in dependency order, running independent stages concurrently.
+
+    Stages that are fresh are skipped unless force is set. Stages depending on a failed stage are not run.
+    Returns True if no stage failed.
+    """
+    dependencies = stage_dependencies(stages)
+    by_name = {stage.name: stage for stage in stages}
+    state = load_state(state_file)
+    state_lock = threading.Lock()
+
+    done, failed = set(), set()
+    pending = [stage.name for stage in stages]
+    running = {}
+
+    def run_stage(stage):
+        if not force and is_fresh(stage, state):
+            print(f"Skipping {stage.name}: outputs are up to date")
+            logger.info(f"Skipped {stage.name} (up to date)")
+            return True
+        success = stage.run()
+        if success:
+            with state_lock:
+                state[stage.name] = repr(stage.key)
+                save_state(state_file, state)
+        return success
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(stages) or 1) as executor:
+        while pending or running:
+            # Stages whose upstream failed are not run, and neither is anything downstream of them.
+            blocked = [name for name in pending if dependencies[name] & failed]
+            while blocked:
+                for name in blocked:
+                    logger.error(f"Not running {name} because an upstream stage failed")
+                    pending.remove(name)
+                    failed.add(name)
+                blocked = [name for name in pending if dependencies[name] & failed]
+
+            # Submit every stage whose dependencies have all finished.
+            for name in [name for name in pending if dependencies[name] <= done]:
+                pending.remove(name)
+                running[executor.submit(run_stage, by_name[name])] = name
+
+            if not running:
+                if pending:
+                    raise ValueError(f"Circular dependency between stages: {', '.join(pending)}")
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    success = future.result()
+                except Exception as e:
+                    logger.error(f"Error in {name}: {e}")
+                    success = False
+                (done if success else failed).add(name)
+
+    return not failed
@@ -0,0 +1,553 @@
+# service.py
+# Local HTTP/JSON service answering price, COGS and inflation forecast queries from memory. The predictive
+# inflation data, the sales averages and the fitted models are loaded once at startup into a registry, so a
+# query costs a lookup or a small vectorized computation instead of a pipeline run.
+#
+# Usage: python service.py [--data-dir data/] [--port 8000] [--models sarima arima linreg ar]
+#        python service.py --load-test 2000 [--concurrency 50] [--port 8000]
+#
+# Endpoints (POST takes and returns JSON):
+#   POST /adjust_price   {"year": 2025, "category": "Food and Beverage", "price": 10.0, "dataset": "predictive"}
+#   POST /project_cogs   {"initial_cogs": 100, "start_year": 2019, "start_month": 1, "dataset": "predictive"}
+#   POST /forecast       {"model": "sarima", "category": "Food at home", "steps": 12}
+#   GET  /metrics        request counts, p50/p99 latency, cache hits and batch sizes
+#   GET  /health
+import os
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import etl.storage as storage
+import analysis.predict as predict
+import analysis.predict_ARIMA as predict_ARIMA
+import analysis.predict_LinReg as predict_LinReg
+import analysis.predict_AR as predict_AR
+import analysis.price_forecast as price_forecast
+import analysis.order_search as order_search
+import vis.supermarket_forecast as supermarket_forecast
+
+# Categories forecast by every model.
+categories = ['Food at home', 'Food Away from home', 'Food and Beverage']
+
+# Year range supported by the price and COGS queries, the same as main.py.
+first_year = 2014
+last_year = 2030
+
+# Months covered by COGS projections, the same as the pipeline's supermarket_forecast stage.
+cogs_start = '2014-02-01'
+cogs_end = '2030-12-01'
+
+# Predictive datasets written by the pipeline that price and COGS queries can use, keyed by their query name.
+# 'predictive' is the data of the last model run; the others are kept by the pipeline for evaluation.
+dataset_files = {
+    'predictive': 'predictive_inflation.csv',
+    'arima': 'predictive_inflation_ARIMA.csv',
+    'linreg': 'predictive_inflation_LinReg.csv',
+    'ar': 'predictive_inflation_AR.csv'
+}
+
+# Models that can answer forecast queries. Fits are taken from the model cache when the pipeline already made them.
+model_names = ['sarima', 'arima', 'linreg', 'ar']
+max_forecast_steps = 240
+
+# Queries arriving within batch_window seconds of each other are answered by one vectorized call.
+batch_window = 0.002
+max_batch_size = 256
+
+# Responses kept in the response cache, least recently used first out.
+cache_size = 4096
+
+# Latencies kept per endpoint for the percentiles.
+latency_samples = 100000
+
+# Largest request body accepted, in bytes. Queries are small JSON objects.
+max_body_size = 64 * 1024
+
+#-----------------------------------------------------------------------------------#
+
+# Model registry.
+def load_dataset_entry(data_dir, name):
+    """Load a predictive dataset with its price index and monthly rates. Returns None if the pipeline has not written it."""
+    path = storage.dataset_path(f'{data_dir}{dataset_files[name]}')
+    if not os.path.exists(path):
+        return None
+    inflation_df = storage.load_dataset(path)
+    return {'inflation': inflation_df, 'price_index': price_forecast.build_price_index(inflation_df)}
+
+def fit_forecaster(model, history, category, cache_dir=None, orders_file=None):
+    """Fit a model on one category's history and return a function forecasting the next steps months."""
+    if model == 'sarima':
+        order, seasonal_order = order_search.chosen_orders('SARIMA', category, orders_file)
+        model_fit = predict.fit_sarima_model(history, category, order=order, seasonal_order=seasonal_order, cache_dir=cache_dir)
+        return lambda steps: np.asarray(predict.forecast_inflation(model_fit, steps), dtype=float)
+    if model == 'arima':
+        order, _ = order_search.chosen_orders('ARIMA', category, orders_file)
+        model_fit = predict_ARIMA.fit_arima_model(history, category, order=order, cache_dir=cache_dir)
+        return lambda steps: np.asarray(predict_ARIMA.forecast_inflation(model_fit, steps), dtype=float)
+    if model == 'ar':
+        model_fit = predict_AR.fit_ar_model(history, category)
+        return lambda steps: predict_AR.forecast_inflation(model_fit, steps)
+
+    category_df = history[history['Category'] == category].reset_index()
+    last_period = category_df['Period'].max()
+    return lambda steps: predict_LinReg.predict_inflation(category_df, pd.period_range(last_period + 1, periods=steps, freq='M'))
+
+def load_registry(data_dir, models=None):
+    """
+    Load everything queries are answered from: the predictive datasets with their price indexes, the sales
+    averages, the COGS projection months and a fitted model per model and category.
+    """
+    sales_df = storage.load_dataset(storage.dataset_path(f'{data_dir}transformed_supermarket_sales.csv'))
+    average_total, average_unit_price = price_forecast.calculate_averages(sales_df)
+
+    datasets = {name: load_dataset_entry(data_dir, name) for name in dataset_files}
+    datasets = {name: entry for name, entry in datasets.items() if entry is not None}
+    if 'predictive' not in datasets:
+        raise FileNotFoundError(f"{data_dir}{dataset_files['predictive']} not found; run the pipeline first")
+
+    # Months of the COGS projections, as built by the pipeline's supermarket_forecast stage.
+    cogs_months = pd.DataFrame({'Date': pd.date_range(start=cogs_start, end=cogs_end, freq='MS')})
+    cogs_months['Year'] = cogs_months['Date'].dt.year
+    cogs_months['Month'] = cogs_months['Date'].dt.month
+
+    history = predict.preprocess_data(predict.load_data(storage.dataset_path(f'{data_dir}inflation.csv')))
+    cache_dir = os.path.join(data_dir, 'model_cache')
+    orders_file = os.path.join(data_dir, 'model_orders.json')
+    forecasters = {}
+    for model in models or model_names:
+        for category in categories:
+            print(f"Loading {model} model for {category}")
+            forecasters[model, category] = fit_forecaster(model, history, category, cache_dir, orders_file)
+
+    return {
+        'datasets': datasets,
+        'average_total': average_total,
+        'average_unit_price': average_unit_price,
+        'average_gross_margin': supermarket_forecast.calculate_average_gross_margin(sales_df),
+        'cogs_months': cogs_months,
+        'cogs_dates': cogs_months['Date'].dt.strftime('%Y-%m').tolist(),
+        'last_period': history.index.max(),
+        'forecasters': forecasters
+    }
+
+def dataset_entry(registry, query):
+    """The predictive dataset a query asks for ('predictive' by default)."""
+    name = query.get('dataset', 'predictive')
+    if name not in registry['datasets']:
+        raise ValueError(f"Unknown or missing dataset {name!r}, available: {', '.join(registry['datasets'])}")
+    return name, registry['datasets'][name]
+
+def query_year(value, name='year'):
+    """Validate a year given in a query."""
+    if not isinstance(value, int) or isinstance(value, bool) or not first_year <= value <= last_year:
+        raise ValueError(f"{name} must be a whole number between {first_year} and {last_year}")
+    return value
+
+def query_number(value, name):
+    """Validate a number given in a query. Numbers too large for a float (e.g. 1e400) are rejected."""
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        raise ValueError(f"{name} must be a number")
+    try:
+        finite = math.isfinite(value)
+    except OverflowError:
+        finite = False
+    if not finite:
+        raise ValueError(f"{name} is out of range")
+    return value
+
+#-----------------------------------------------------------------------------------#
+
+# Batched query handlers. Each takes a list of queries and returns one result (or exception) per query.
+def adjust_price_batch(registry, queries):
+    """Adjust base year prices to each query's year, one vectorized index lookup per dataset."""
+    results = [None] * len(queries)
+    groups = {}
+    for i, query in enumerate(queries):
+        try:
+            name, entry = dataset_entry(registry, query)
+            year = query_year(query.get('year'))
+            category = query.get('category', price_forecast.default_category)
+            if category not in entry['price_index'].columns:
+                raise ValueError(f"Unknown category {category!r}")
+            if year not in entry['price_index'].index:
+                raise ValueError(f"No inflation data for year {year}")
+            price = query.get('price')
+            if price is not None:
+                query_number(price, 'price')
+            groups.setdefault(name, []).append((i, year, category, price))
+        except ValueError as e:
+            results[i] = e
+
+    for name, items in groups.items():
+        indices, years, query_categories, prices = zip(*items)
+        factors = price_forecast.index_factors(list(years), registry['datasets'][name]['price_index'], list(query_categories))
+        for i, year, category, price, factor in zip(indices, years, query_categories, prices, factors):
+            result = {
+                'year': year,
+                'category': category,
+                'factor': float(factor),
+                'average_total': float(registry['average_total'] * factor),
+                'average_unit_price': float(registry['average_unit_price'] * factor)
+            }
+            if price is not None:
+                result['price'] = float(price * factor)
+            results[i] = result
+    return results
+
+def project_cogs_batch(registry, queries):
+    """Project every query's COGS scenario, all scenarios of a dataset in one project_cogs call."""
+    results = [None] * len(queries)
+    groups = {}
+    for i, query in enumerate(queries):
+        try:
+            name, _ = dataset_entry(registry, query)
+            initial_cogs = query_number(query.get('initial_cogs'), 'initial_cogs')
+            start_year = query_year(query.get('start_year'), 'start_year')
+            start_month = query.get('start_month')
+            if not isinstance(start_month, int) or isinstance(start_month, bool) or not 1 <= start_month <= 12:
+                raise ValueError("start_month must be a whole number between 1 and 12")
+            groups.setdefault(name, []).append((i, (initial_cogs, start_year, start_month)))
+        except ValueError as e:
+            results[i] = e
+
+    for name, items in groups.items():
+        indices, scenarios = zip(*items)
+        projected = supermarket_forecast.project_cogs(registry['cogs_months'], registry['datasets'][name]['inflation'], scenarios)
+        projected = projected.to_numpy()
+        gross_income = supermarket_forecast.calculate_gross_income(projected, registry['average_gross_margin'])
+        for row, i in enumerate(indices):
+            results[i] = {
+                'dates': registry['cogs_dates'],
+                'projected_cogs': projected[row].tolist(),
+                'projected_gross_income': gross_income[row].tolist()
+            }
+    return results
+
+def forecast_batch(registry, queries):
+    """Forecast each query's model and category. Queries for the same model and category share one forecast."""
+    results = [None] * len(queries)
+    groups = {}
+    for i, query in enumerate(queries):
+        try:
+            key = (query.get('model', 'sarima'), query.get('category', price_forecast.default_category))
+            if key not in registry['forecasters']:
+                raise ValueError(f"No {key[0]} model loaded for category {key[1]!r}")
+            steps = query.get('steps', 12)
+            if not isinstance(steps, int) or isinstance(steps, bool) or not 1 <= steps <= max_forecast_steps:
+                raise ValueError(f"steps must be a whole number between 1 and {max_forecast_steps}")
+            groups.setdefault(key, []).append((i, steps))
+        except ValueError as e:
+            results[i] = e
+
+    periods = pd.period_range(registry['last_period'] + 1, periods=max_forecast_steps, freq='M').strftime('%Y-%m')
+    for (model, category), items in groups.items():
+        forecast = registry['forecasters'][model, category](max(steps for _, steps in items))
+        for i, steps in items:
+            results[i] = {'model': model, 'category': category,
+                          'periods': list(periods[:steps]), 'inflation_rate': forecast[:steps].tolist()}
+    return results
+
+class Batcher:
+    """
+    Collects the queries to one endpoint arriving within a short window and answers them with one call to a
+    batch handler. Batches run one at a time in the batcher's own thread, so the event loop keeps serving
+    connections and the queries arriving meanwhile make up the next batch.
+    """
+    def __init__(self, handle_batch, window=batch_window, max_size=max_batch_size):
+        self.handle_batch = handle_batch
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.window = window
+        self.max_size = max_size
+        self.pending = []
+        self.timer = None
+        self.batch_sizes = deque(maxlen=latency_samples)
+
+    async def submit(self, query):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((query, future))
+        if len(self.pending) >= self.max_size:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.window, self.flush)
+        return await future
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if batch:
+            self.batch_sizes.append(len(batch))
+            asyncio.ensure_future(self.run(batch))
+
+    async def run(self, batch):
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(self.executor, self.handle_batch, [query for query, _ in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+#-----------------------------------------------------------------------------------#
+
+# HTTP server.
+status_reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+                  500: 'Internal Server Error'}
+
+def create_service(registry):
+    """Build the service state: a batcher per query endpoint, the response cache and the latency metrics."""
+    return {
+        'registry': registry,
+        'batchers': {
+            '/adjust_price': Batcher(lambda queries: adjust_price_batch(registry, queries)),
+            '/project_cogs': Batcher(lambda queries: project_cogs_batch(registry, queries)),
+            '/forecast': Batcher(lambda queries: forecast_batch(registry, queries))
+        },
+        'cache': OrderedDict(),
+        'cache_lock': threading.Lock(),
+        'cache_hits': 0,
+        'cache_misses': 0,
+        'latencies': {},
+        'started': time.time()
+    }
+
+def cached_response(service, key):
+    """Return a cached response body, or None."""
+    with service['cache_lock']:
+        body = service['cache'].get(key)
+        if body is None:
+            service['cache_misses'] += 1
+            return None
+        service['cache'].move_to_end(key)
+        service['cache_hits'] += 1
+        return body
+
+def cache_response(service, key, body):
+    """Keep a response body, dropping the least recently used ones past cache_size."""
+    with service['cache_lock']:
+        service['cache'][key] = body
+        service['cache'].move_to_end(key)
+        while len(service['cache']) > cache_size:
+            service['cache'].popitem(last=False)
+
+def latency_metrics(service):
+    """Request count and p50/p99 latency in milliseconds per endpoint, plus cache and batching statistics."""
+    endpoints = {}
+    for path, samples in service['latencies'].items():
+        latencies = np.fromiter(samples, dtype=float) * 1000
+        endpoints[path] = {'requests': len(latencies),
+                           'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+                           'p99_ms': round(float(np.percentile(latencies, 99)), 3)}
+    batches = {path: {'batches': len(batcher.batch_sizes),
+                      'mean_batch_size': round(float(np.mean(batcher.batch_sizes)), 2) if batcher.batch_sizes else 0.0}
+               for path, batcher in service['batchers'].items()}
+    return {'uptime_seconds': round(time.time() - service['started'], 1), 'endpoints': endpoints, 'batching': batches,
+            'cache': {'hits': service['cache_hits'], 'misses': service['cache_misses'], 'entries': len(service['cache'])}}
+
+def reject_constant(value):
+    """NaN and Infinity are not valid JSON and never accepted in queries."""
+    raise ValueError(f"{value} is not a valid number")
+
+async def handle_request(service, method, path, body):
+    """Answer one request. Returns (status, JSON body as bytes)."""
+    if path == '/health':
+        return 200, b'{"status": "ok"}'
+    if path == '/metrics':
+        return 200, json.dumps(latency_metrics(service)).encode()
+    if path not in service['batchers']:
+        return 404, json.dumps({'error': f"Unknown endpoint {path}"}).encode()
+    if method != 'POST':
+        return 405, json.dumps({'error': f"{path} only accepts POST"}).encode()
+
+    try:
+        query = json.loads(body or b'{}', parse_constant=reject_constant)
+        if not isinstance(query, dict):
+            raise ValueError("the request body must be a JSON object")
+    except ValueError as e:
+        return 400, json.dumps({'error': f"Invalid JSON: {e}"}).encode()
+
+    # Identical queries get the cached response without being batched again.
+    key = (path, json.dumps(query, sort_keys=True))
+    response = cached_response(service, key)
+    if response is not None:
+        return 200, response
+
+    try:
+        result = await service['batchers'][path].submit(query)
+    except ValueError as e:
+        return 400, json.dumps({'error': str(e)}).encode()
+    except Exception as e:
+        return 500, json.dumps({'error': str(e)}).encode()
+
+    try:
+        # Results that overflow (e.g. a huge initial COGS) cannot be written as valid JSON.
+        response = json.dumps(result, allow_nan=False).encode()
+    except ValueError:
+        return 400, json.dumps({'error': "The result is out of range; use smaller inputs"}).encode()
+    cache_response(service, key, response)
+    return 200, response
+
+async def handle_connection(service, reader, writer):
+    """Serve the HTTP/1.1 requests of one connection, keeping it open between requests unless asked to close."""
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            start = time.perf_counter()
+            try:
+                method, target, version = request_line.decode('latin-1').split()
+            except ValueError:
+                writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+                break
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            try:
+                length = int(headers.get('content-length') or 0)
+            except ValueError:
+                length = -1
+            if not 0 <= length <= max_body_size:
+                # The body is never read, so the connection cannot be reused.
+                status = 413 if length > max_body_size else 400
+                response = json.dumps({'error': f"The request body must be at most {max_body_size} bytes"
+                                       if status == 413 else "Invalid Content-Length"}).encode()
+                writer.write(f'HTTP/1.1 {status} {status_reasons[status]}\r\n'
+                             f'Content-Type: application/json\r\nContent-Length: {len(response)}\r\n'
+                             f'Connection: close\r\n\r\n'.encode() + response)
+                await writer.drain()
+                break
+            body = await reader.readexactly(length)
+
+            path = target.split('?', 1)[0]
+            status, response = await handle_request(service, method, path, body)
+            keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+
+            writer.write(f'HTTP/1.1 {status} {status_reasons[status]}\r\n'
+                         f'Content-Type: application/json\r\nContent-Length: {len(response)}\r\n'
+                         f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode() + response)
+            await writer.drain()
+            if status != 404:
+                service['latencies'].setdefault(path, deque(maxlen=latency_samples)).append(time.perf_counter() - start)
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+async def serve(registry, host, port):
+    """Serve queries until interrupted."""
+    service = create_service(registry)
+    server = await asyncio.start_server(lambda reader, writer: handle_connection(service, reader, writer), host, port)
+    print(f"Serving on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+#-----------------------------------------------------------------------------------#
+
+# Load test.
+def sample_query(rng):
+    """A random query to one of the endpoints, drawn from a small set so the response cache gets some hits."""
+    endpoint = rng.choice(['/adjust_price', '/project_cogs', '/forecast'])
+    if endpoint == '/adjust_price':
+        return endpoint, {'year': rng.randint(first_year, last_year), 'price': rng.choice([1.0, 10.0, 100.0])}
+    if endpoint == '/project_cogs':
+        return endpoint, {'initial_cogs': rng.choice([50, 100, 250]), 'start_year': rng.randint(first_year, 2025),
+                          'start_month': rng.randint(1, 12)}
+    return endpoint, {'model': rng.choice(['sarima', 'ar']), 'category': rng.choice(categories), 'steps': rng.randint(1, 60)}
+
+async def load_test_client(host, port, queries, latencies):
+    """Send queries one after another over a single keep-alive connection."""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for endpoint, query in queries:
+            body = json.dumps(query).encode()
+            start = time.perf_counter()
+            writer.write(f'POST {endpoint} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n'
+                         f'Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+            await writer.drain()
+            status_line = await reader.readline()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.strip().lower() == 'content-length':
+                    length = int(value)
+            await reader.readexactly(length)
+            if b' 200 ' not in status_line:
+                raise RuntimeError(f"{endpoint} {query} failed: {status_line.decode().strip()}")
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+async def load_test(host, port, requests, concurrency, seed=0):
+    """Send requests random queries from concurrency connections; print throughput, client latency and the server's metrics."""
+    rng = random.Random(seed)
+    queries = [sample_query(rng) for _ in range(requests)]
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(load_test_client(host, port, queries[i::concurrency], latencies) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    print(f"{requests} requests over {concurrency} connections in {elapsed:.2f} s ({requests / elapsed:.0f} requests/s)")
+    print(f"Client latency: p50 {np.percentile(latencies, 50):.2f} ms, p99 {np.percentile(latencies, 99):.2f} ms")
+
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f'GET /metrics HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n'.encode())
+    response = await reader.read()
+    writer.close()
+    print("Server metrics:")
+    print(json.dumps(json.loads(response.split(b'\r\n\r\n', 1)[1]), indent=2))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve price, COGS and inflation forecast queries over local HTTP/JSON.")
+    parser.add_argument('--data-dir', default='data/', help="directory holding the pipeline outputs (default: data/)")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8000, help="port to listen on (default: 8000)")
+    parser.add_argument('--models', nargs='+', choices=model_names, help="models loaded for forecast queries (default: all)")
+    parser.add_argument('--storage-format', choices=list(storage.format_extensions), default='csv',
+                        help="format the pipeline stored its datasets in (default: csv)")
+    parser.add_argument('--load-test', type=int, metavar='REQUESTS', help="send this many queries to a running service instead of serving")
+    parser.add_argument('--concurrency', type=int, default=50, help="connections used by --load-test (default: 50)")
+    args = parser.parse_args(argv)
+
+    if args.load_test:
+        asyncio.run(load_test(args.host, args.port, args.load_test, args.concurrency))
+        return 0
+
+    data_dir = args.data_dir if args.data_dir.endswith(('/', os.sep)) else args.data_dir + '/'
+    storage.set_format(args.storage_format)
+    registry = load_registry(data_dir, args.models)
+    try:
+        asyncio.run(serve(registry, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+# downsample.py
+import numpy as np
+
+# Downsampling of long traces before they are plotted. A trace is cut down to a budget of points, chosen so the
+# line keeps its shape and its extremes: largest-triangle-three-buckets (LTTB) keeps the points that shape the
+# line the most, min-max keeps the lowest and highest point of each bucket. With no budget every point is kept.
+default_method = 'lttb'
+
+# Smallest budget either method can work with: the first and last point plus a bucket's minimum and maximum.
+min_points = 4
+
+# Traces with more points than this are drawn with Scattergl (WebGL) instead of SVG.
+webgl_threshold = 1000
+
+def lttb_indices(x, y, max_points):
+    """
+    Indices of the max_points points picked by largest-triangle-three-buckets.
+
+    The first and last points are always kept. The points in between are split into max_points - 2 buckets,
+    and each bucket keeps the point forming the largest triangle with the point kept from the previous bucket
+    and the average of the next bucket.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if max_points >= n:
+        return np.arange(n)
+
+    # Bucket edges from the second to the last point, computed in integers so no bucket is empty.
+    edges = np.arange(max_points - 1) * (n - 2) // (max_points - 2) + 1
+    edges = np.append(edges, n)
+    selected = np.empty(max_points, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_x = x[end:edges[bucket + 2]].mean()
+        next_y = y[end:edges[bucket + 2]].mean()
+
+        # Twice the triangle areas; only the largest matters.
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(np.nan_to_num(areas, nan=-1.0)))
+        selected[bucket + 1] = previous
+    return selected
+
+def min_max_indices(x, y, max_points):
+    """
+    Indices of at most max_points points keeping the minimum and maximum of each bucket.
+
+    The first and last points are always kept, and the rest are split into (max_points - 2) // 2 equal buckets.
+    All buckets are reduced at once by sorting the points by bucket and value.
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if max_points >= n:
+        return np.arange(n)
+
+    buckets = (max_points - 2) // 2
+    bucket = np.arange(n) * buckets // n
+    # NaN sorts last, so it is only ever picked as the maximum of a bucket without values.
+    order = np.lexsort((y, bucket))
+    starts = np.searchsorted(bucket[order], np.arange(buckets))
+    ends = np.append(starts[1:], n) - 1
+    return np.unique(np.concatenate([[0, n - 1], order[starts], order[ends]]))
+
+methods = {'lttb': lttb_indices, 'minmax': min_max_indices}
+
+def downsample_indices(x, y, max_points=None, method=None):
+    """Indices of the points to plot, in order. Every point is kept when max_points is None."""
+    if max_points is None:
+        return np.arange(len(y))
+    if max_points < min_points:
+        raise ValueError(f"At least {min_points} points per trace are needed to downsample, got {max_points}")
+    method = method or default_method
+    if method not in methods:
+        raise ValueError(f"Unknown downsampling method {method!r}, expected one of: {', '.join(methods)}")
+    return methods[method](x, y, max_points)
+
+def downsample(df, x, y_column, max_points=None, method=None):
+    """Rows of df to plot against x (numeric positions, one per row) for the y_column trace."""
+    if max_points is None or len(df) <= max_points:
+        return df
+    return df.iloc[downsample_indices(x, df[y_column].to_numpy(), max_points, method)]
@@ -1,19 +1,26 @@
-import pandas as pd
-import plotly.graph_objects as go
-import plotly.io as pio
+import etl.storage as storage
+import etl.periods as periods
+import vis.render as render
+import vis.downsample as downsample
 
 # Define the directory to store the processed data.
 data_dir = 'data/'
 
 def load_data(file_path):
-    """Load CSV data into a DataFrame."""
-    return pd.read_csv(file_path)
+    """Load a dataset saved in the configured storage format into a DataFrame."""
+    return storage.load_dataset(file_path)
 
-def plot_inflation_data(df):
-    """Plot predictive inflation data by category and save to a .png file."""
-    # Print the unique categories to verify data.
-    print("Available categories in the data:")
-    print(df['Category'].unique())
+def hover_text(category_df):
+    """Hover labels such as 'January 2024: 2.35%', built column-wise rather than row by row."""
+    return category_df['Period'].dt.strftime('%B %Y') + ': ' + category_df['Inflation Rate'].map('{:.2f}%'.format)
+
+def build_inflation_figure(df, max_points=None, method=None):
+    """
+    Build the line chart of predictive inflation by category. With max_points, each category's trace is cut
+    down to that many points with the downsampling method ('lttb' or 'minmax'); otherwise every month is plotted.
+    """
+    # Plotly is imported when a plot is drawn, which keeps it out of the pipeline's startup.
+    import plotly.graph_objects as go
 
     # Define the categories to plot.
     categories = ['Food and Beverage', 'Food Away from home', 'Food at home']
@@ -24,25 +31,26 @@ def plot_inflation_data(df):
     # Plot the data for each category.
     for category in categories:
         # Filter the data for the current category.
-        category_df = df[df['Category'] == category].copy()
+        category_df = df[df['Category'] == category]
         
         # Check if there is data for this category.
         if category_df.empty:
             print(f"No data found for category: {category}")
             continue
         
-        # Convert 'Period' to datetime format to extract the year.
-        category_df['Period'] = pd.to_datetime(category_df['Period'], format='%B %Y')
-        category_df.sort_values('Period', inplace=True)  # Sort by date
-        
-        # Add a trace for the category to synthesize the line graph.
-        fig.add_trace(go.Scatter(
-            x=category_df['Period'],
+        category_df = category_df.sort_values('Period')  # Sort by date
+        category_df = downsample.downsample(category_df, periods.month_index(category_df['Period']).to_numpy(),
+                                            'Inflation Rate', max_points, method)
+
+        # Add a trace for the category to synthesize the line graph. Large traces are drawn with WebGL.
+        scatter = go.Scattergl if len(category_df) > downsample.webgl_threshold else go.Scatter
+        fig.add_trace(scatter(
+            x=periods.to_timestamps(category_df['Period']),
             y=category_df['Inflation Rate'],
             mode='lines+markers',
             name=category,
             hoverinfo='text',
-            text=category_df.apply(lambda row: f"{row['Period'].strftime('%B %Y')}: {row['Inflation Rate']:.2f}%", axis=1)
+            text=hover_text(category_df)
         ))
 
     # Update the layout for the figure.
@@ -56,10 +64,31 @@ def plot_inflation_data(df):
         ),
         hovermode='x unified'
     )
+    return fig
+
+def render_job(df, output_files, max_points=None, method=None):
+    """Rendering job for the inflation chart, keyed on the data it is drawn from and the downsampling."""
+    output_files = [output_files] if isinstance(output_files, str) else list(output_files)
+    if max_points is not None:
+        method = method or downsample.default_method
+    return render.RenderJob(lambda: build_inflation_figure(df, max_points, method), output_files,
+                            render.data_hash(df, 'inflation by category', max_points, method))
+
+def plot_inflation_data(df, output_file='predictive_inflation_rate_by_category.png', show=True, force=False,
+                        max_points=None, method=None):
+    """
+    Plot predictive inflation data by category and save it to output_file (.png by default), or to each file
+    of a list, e.g. PNG, SVG and HTML copies. Files already rendered from the same data are not redrawn unless
+    force is set. max_points caps the points of each category's trace (full resolution when None).
+    Set show=False when running headless.
+    """
+    # Print the unique categories to verify data.
+    print("Available categories in the data:")
+    print(df['Category'].unique())
 
-    # Save the plot to a .png file.
-    output_file = 'predictive_inflation_rate_by_category.png'
-    pio.write_image(fig, output_file)
-    print(f"Plot saved to {output_file}")
+    job = render_job(df, output_file, max_points, method)
+    if show:
+        fig, job = render.prebuilt(job)
+        fig.show()
 
-    fig.show()
+    render.render_figures([job], force)
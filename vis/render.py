@@ -0,0 +1,135 @@
+# render.py
+import os
+import json
+import hashlib
+import threading
+from collections import namedtuple
+import pandas as pd
+
+# Offscreen rendering of the pipeline's figures. Nothing is ever shown: every figure is written to its output
+# files, static images all go through one kaleido process that is started on first use and kept for the rest
+# of the run, and an output is only rendered again when the data it was drawn from has changed.
+
+# File kept in each output directory with the data hash every output there was rendered from.
+manifest_name = '.render_manifest.json'
+
+# Formats kaleido can export. 'html' (and 'json') are written by plotly itself without kaleido.
+image_formats = ['png', 'svg', 'pdf', 'jpeg', 'webp']
+figure_formats = image_formats + ['html', 'json']
+
+# A figure to render. build takes no arguments and returns the plotly figure; it is only called when at least
+# one of the outputs is missing or out of date. key is the hash of the data the figure is drawn from.
+RenderJob = namedtuple('RenderJob', ['build', 'outputs', 'key'])
+
+# kaleido handles one export at a time, and stages can render concurrently.
+image_lock = threading.Lock()
+manifest_lock = threading.Lock()
+
+def data_hash(*items):
+    """Hash the data a figure is drawn from: DataFrames and Series by content, anything else by its repr."""
+    digest = hashlib.sha256()
+    for item in items:
+        if isinstance(item, (pd.DataFrame, pd.Series)):
+            digest.update(pd.util.hash_pandas_object(item, index=False).values.tobytes())
+            digest.update(repr(list(item.columns) if isinstance(item, pd.DataFrame) else item.name).encode())
+        else:
+            digest.update(repr(item).encode())
+    return digest.hexdigest()
+
+def output_format(output_file):
+    """The export format of an output file, taken from its extension."""
+    fmt = os.path.splitext(output_file)[1].lstrip('.').lower()
+    fmt = 'jpeg' if fmt == 'jpg' else fmt
+    if fmt not in figure_formats:
+        raise ValueError(f"Unsupported figure format {fmt!r}, expected one of: {', '.join(figure_formats)}")
+    return fmt
+
+def manifest_path(output_file):
+    """Path of the manifest covering an output file."""
+    return os.path.join(os.path.dirname(output_file) or '.', manifest_name)
+
+def load_manifest(path):
+    """Load a manifest of {output file name: data hash}."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def is_current(output_file, key):
+    """An output is current when it exists and was rendered from data with the same hash."""
+    if key is None or not os.path.exists(output_file):
+        return False
+    return load_manifest(manifest_path(output_file)).get(os.path.basename(output_file)) == key
+
+def record_outputs(output_files, key):
+    """Record the data hash the outputs were rendered from."""
+    by_manifest = {}
+    for output_file in output_files:
+        by_manifest.setdefault(manifest_path(output_file), []).append(os.path.basename(output_file))
+
+    with manifest_lock:
+        for path, names in by_manifest.items():
+            manifest = load_manifest(path)
+            manifest.update({name: key for name in names})
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(manifest, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, path)
+
+def image_scope():
+    """The kaleido scope used for every static image. Plotly starts its kaleido process on the first export and
+    keeps it running, so sharing the one scope avoids starting a new process per figure."""
+    import plotly.io as pio
+    return pio.kaleido.scope
+
+def write_output(fig, output_file):
+    """Write a figure to one output file in the format given by its extension."""
+    fmt = output_format(output_file)
+    directory = os.path.dirname(output_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    if fmt == 'html':
+        fig.write_html(output_file)
+    elif fmt == 'json':
+        fig.write_json(output_file)
+    else:
+        figure = fig.to_dict()
+        with image_lock:
+            image = image_scope().transform(figure, format=fmt)
+        tmp_file = f'{output_file}.tmp'
+        with open(tmp_file, 'wb') as f:
+            f.write(image)
+        os.replace(tmp_file, output_file)
+
+def prebuilt(job):
+    """Build a job's figure now, e.g. to show it, and return it with a job that reuses it instead of building it again."""
+    fig = job.build()
+    return fig, job._replace(build=lambda: fig)
+
+def render_figures(jobs, force=False):
+    """
+    Render a batch of figures to their output files in one pass.
+
+    A job whose outputs all exist and were rendered from data with the same key is skipped without building
+    its figure; otherwise the figure is built once and written to every output that is missing or out of date.
+    Jobs without outputs (figures that are only shown) are left alone. Returns the list of files written.
+    """
+    written = []
+    for job in jobs:
+        if not job.outputs:
+            continue
+        stale = [output_file for output_file in job.outputs if force or not is_current(output_file, job.key)]
+        if not stale:
+            print(f"Skipping {', '.join(job.outputs)}: already rendered from the same data")
+            continue
+
+        fig = job.build()
+        for output_file in stale:
+            write_output(fig, output_file)
+            print(f"Plot saved to {output_file}")
+        if job.key is not None:
+            record_outputs(stale, job.key)
+        written.extend(stale)
+    return written
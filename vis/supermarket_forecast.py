@@ -1,5 +1,8 @@
+import numpy as np
 import pandas as pd
-import plotly.graph_objects as go
+import etl.storage as storage
+import etl.periods as periods
+import vis.render as render
 
 def get_user_input():
     """
@@ -33,12 +36,12 @@ def get_user_input():
     
     return initial_cogs, start_year, start_month
 
-def load_data():
+def load_data(data_dir='data/'):
     """
-    Function to load data from CSV files.
+    Function to load data saved in the configured storage format.
     """
-    inflation_df = pd.read_csv('data/predictive_inflation.csv')
-    sales_df = pd.read_csv('data/transformed_supermarket_sales.csv')
+    inflation_df = storage.load_dataset(f'{data_dir}predictive_inflation.csv')
+    sales_df = storage.load_dataset(f'{data_dir}transformed_supermarket_sales.csv')
     return inflation_df, sales_df
 
 def calculate_average_gross_margin(sales_df):
@@ -47,36 +50,73 @@ def calculate_average_gross_margin(sales_df):
     """
     return sales_df['gross margin percentage'].mean()
 
+def monthly_inflation_rates(forecast_df, inflation_df):
+    """
+    Function to line up the inflation rate of each forecast month by joining on a year-month key.
+    Where history and forecast overlap within a category the historical rate is used; when a month still appears
+    more than once (in several categories), the last row wins. Months without data get 0.
+    """
+    rates = periods.drop_duplicate_months(inflation_df)
+    rates = rates.assign(Key=periods.month_index(rates['Period']))
+    rates = rates.drop_duplicates('Key', keep='last').set_index('Key')['Inflation Rate']
+    forecast_keys = forecast_df['Year'] * 12 + forecast_df['Month'] - 1
+    return rates.reindex(forecast_keys).fillna(0).to_numpy()
+
 def apply_inflation_deflation(forecast_df, inflation_df, initial_cogs, start_year, start_month):
     """
     Function to apply inflation or deflation to the projected COGS based on the inflation data.
+    Months before the start month are deflated (negative rate), months after it inflated, and the start month is unchanged.
     """
-    forecast_df['Inflation Rate'] = 0
-    for index, row in inflation_df.iterrows():
-        period = pd.to_datetime(row['Period'], format='%B %Y')
-        period_month = period.month
-        period_year = period.year
-        if period_year in forecast_df['Year'].values:
-            mask = (forecast_df['Year'] == period_year) & (forecast_df['Month'] == period_month)
-            if period_year < start_year or (period_year == start_year and period_month < start_month):
-                forecast_df.loc[mask, 'Inflation Rate'] = -row['Inflation Rate']
-            elif period_year > start_year or (period_year == start_year and period_month > start_month):
-                forecast_df.loc[mask, 'Inflation Rate'] = row['Inflation Rate']
-    
-    forecast_df.fillna(0, inplace=True)
+    forecast_keys = (forecast_df['Year'] * 12 + forecast_df['Month'] - 1).to_numpy()
+    sign = np.sign(forecast_keys - (start_year * 12 + start_month - 1))
+
+    forecast_df['Inflation Rate'] = sign * monthly_inflation_rates(forecast_df, inflation_df)
     forecast_df['Projected COGS'] = initial_cogs * (1 + forecast_df['Inflation Rate'] / 100).cumprod()
     return forecast_df
 
+def project_cogs(forecast_df, inflation_df, scenarios):
+    """
+    Function to project many (initial_cogs, start_year, start_month) scenarios at once.
+    Returns a scenario x month DataFrame of projected COGS with one column per forecast date, matching
+    apply_inflation_deflation for each scenario.
+    """
+    scenarios = np.asarray(scenarios, dtype=float).reshape(-1, 3)
+    initial_cogs = scenarios[:, 0]
+    start_keys = scenarios[:, 1] * 12 + scenarios[:, 2] - 1
+
+    forecast_keys = (forecast_df['Year'] * 12 + forecast_df['Month'] - 1).to_numpy()
+    rates = monthly_inflation_rates(forecast_df, inflation_df)
+
+    # Sign of every (scenario, month) pair: deflate before the scenario's start month, inflate after it.
+    sign = np.sign(forecast_keys[np.newaxis, :] - start_keys[:, np.newaxis])
+    projected = initial_cogs[:, np.newaxis] * np.cumprod(1 + sign * rates / 100, axis=1)
+
+    index = pd.MultiIndex.from_arrays(
+        [initial_cogs, scenarios[:, 1].astype(int), scenarios[:, 2].astype(int)],
+        names=['Initial COGS', 'Start Year', 'Start Month'])
+    return pd.DataFrame(projected, index=index, columns=pd.Index(forecast_df['Date'], name='Date'))
+
 def calculate_gross_income(cogs, gross_margin):
     """
     Function to calculate the projected gross income based on the projected COGS and average gross margin percentage.
     """
     return cogs * (gross_margin / 100) / (1 - (gross_margin / 100))
 
-def visualize_data(forecast_df, initial_cogs, start_date, avg_gross_margin):
+def add_gross_income(forecast_df, avg_gross_margin):
     """
-    Function to visualize the projected COGS and gross income through plotly.
+    Function to add the 'Projected Gross Income' column for the projected COGS.
+    """
+    forecast_df['Projected Gross Income'] = calculate_gross_income(forecast_df['Projected COGS'], avg_gross_margin)
+    return forecast_df
+
+def build_cogs_figure(forecast_df, initial_cogs, start_date):
     """
+    Function to build the figure of the projected COGS and gross income.
+    forecast_df needs the 'Projected COGS' and 'Projected Gross Income' columns.
+    """
+    # Imports Plotly only when a figure is drawn.
+    import plotly.graph_objects as go
+
     fig = go.Figure()
 
     # Adds line for projected COGS, starting from the adjusted COGS.
@@ -88,7 +128,6 @@ def visualize_data(forecast_df, initial_cogs, start_date, avg_gross_margin):
     ))
 
     # Adds line for projected gross income.
-    forecast_df['Projected Gross Income'] = calculate_gross_income(forecast_df['Projected COGS'], avg_gross_margin)
     fig.add_trace(go.Scatter(
         x=forecast_df['Date'],
         y=forecast_df['Projected Gross Income'],
@@ -109,4 +148,29 @@ def visualize_data(forecast_df, initial_cogs, start_date, avg_gross_margin):
                       xaxis_title='Date',
                       yaxis_title='Amount',
                       legend_title='Legend')
-    fig.show()
\ No newline at end of file
+    return fig
+
+def render_job(forecast_df, initial_cogs, start_date, output_files):
+    """
+    Function to create the rendering job of one COGS projection, keyed on the data the figure is drawn from.
+    Rendering many scenarios' jobs together with render.render_figures exports them in one pass.
+    """
+    output_files = [output_files] if isinstance(output_files, str) else list(output_files)
+    plotted = forecast_df[['Date', 'Projected COGS', 'Projected Gross Income']]
+    return render.RenderJob(lambda: build_cogs_figure(plotted, initial_cogs, start_date), output_files,
+                            render.data_hash(plotted, 'projected cogs', initial_cogs, start_date))
+
+def visualize_data(forecast_df, initial_cogs, start_date, avg_gross_margin, output_file=None, show=True, force=False):
+    """
+    Function to visualize the projected COGS and gross income through plotly.
+    The figure is saved when output_file (or a list of files, one per format) is given, unless it was already
+    rendered from the same data; set show=False when running headless.
+    """
+    add_gross_income(forecast_df, avg_gross_margin)
+    job = render_job(forecast_df, initial_cogs, start_date, output_file or [])
+
+    if show:
+        fig, job = render.prebuilt(job)
+        fig.show()
+
+    render.render_figures([job], force)